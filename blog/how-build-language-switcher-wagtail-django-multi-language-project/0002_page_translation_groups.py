@@ -0,0 +1,92 @@
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Language homepages live at depth 3 and their slug is set to the language code
+LANGUAGE_HOMEPAGE_DEPTH = 3
+# Page.steplen, which historical models do not know about
+PAGE_PATH_STEPLEN = 4
+BATCH_SIZE = 1000
+
+
+def create_translation_groups(apps, schema_editor):
+    """Puts every translatable page into a translation group.
+
+    Pages connected through ``english_link`` end up in the same group, all others in
+    a group of their own.
+    """
+    Page = apps.get_model("wagtailcore", "Page")
+    PageTranslation = apps.get_model("cms", "PageTranslation")
+    language_homepages = dict(
+        Page.objects.filter(depth=LANGUAGE_HOMEPAGE_DEPTH).values_list("path", "slug")
+    )
+    homepage_path_length = PAGE_PATH_STEPLEN * LANGUAGE_HOMEPAGE_DEPTH
+
+    groups = {}
+    translatable_page_ids = set()
+    for model in apps.get_app_config("cms").get_models():
+        if not any(field.name == "english_link" for field in model._meta.fields):
+            continue
+        links = model.objects.values_list("pk", "english_link_id")
+        for page_id, english_link_id in links.iterator():
+            translatable_page_ids.add(page_id)
+            if english_link_id and english_link_id not in groups:
+                groups[english_link_id] = groups.setdefault(page_id, uuid.uuid4())
+                translatable_page_ids.add(english_link_id)
+
+    translations = []
+    used = set()
+    pages = Page.objects.filter(pk__in=translatable_page_ids).values_list("pk", "path")
+    for page_id, path in pages.iterator():
+        language = language_homepages.get(path[:homepage_path_length])
+        if language is None:
+            # not located below a language homepage
+            continue
+        group = groups.get(page_id)
+        if group is None or (group, language) in used:
+            # english_link pointing to a page of the same language
+            group = uuid.uuid4()
+        used.add((group, language))
+        translations.append(
+            PageTranslation(page_id=page_id, group=group, language=language)
+        )
+    PageTranslation.objects.bulk_create(translations, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        # point this to the latest migrations of your app and of wagtail
+        ("wagtailcore", "0040_page_draft_title"),
+        ("cms", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageTranslation",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("group", models.UUIDField(default=uuid.uuid4)),
+                ("language", models.CharField(max_length=7)),
+                (
+                    "page",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="translation",
+                        to="wagtailcore.Page",
+                    ),
+                ),
+            ],
+            options={"unique_together": {("group", "language")}},
+        ),
+        migrations.RunPython(create_translation_groups, migrations.RunPython.noop),
+    ]
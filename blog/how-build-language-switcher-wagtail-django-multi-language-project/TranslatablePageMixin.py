@@ -1,12 +1,29 @@
-from collections import OrderedDict
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Iterable, List
 
+from asgiref.sync import sync_to_async
+from django.apps import apps
 from django.conf import settings
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
 from django.utils import translation
-from django.utils.functional import cached_property
-from django.utils.translation import ugettext_lazy as _
+from django.utils.functional import SimpleLazyObject, cached_property
+from django.utils.translation import gettext_lazy as _
 from wagtail.admin.edit_handlers import PageChooserPanel
-from wagtail.core.models import Page
+from wagtail.core.models import Page, PageManager, Site
+from wagtail.core.query import PageQuerySet
+from wagtail.core.signals import post_page_move
+
+from codista.cms.cache_versions import (
+    aget_cache_version,
+    bump_cache_version,
+    get_cache_version,
+)
 
 # should be added to your configuration / settings.py
 OUR_I18N_METADATA = {
@@ -16,10 +33,320 @@ OUR_I18N_METADATA = {
     "en": {"display_name": "English", "flag_code": "gb", "iso15897": "en_US"},
 }
 
+# The language homepages are located at depth 3 and their slug is always set to the
+# language code.
+LANGUAGE_HOMEPAGE_DEPTH = 3
+
+# Process wide map of language homepage paths to their language code, e.g.
+# ``{"000100010001": "de", "000100010002": "en"}``, together with the version it was
+# loaded for. It is loaded lazily. The signal handlers at the bottom of this module
+# bump the version in the (shared) cache whenever a page changes that could affect
+# it, which makes every process reload its map on next access.
+_language_homepages = None
+LANGUAGE_HOMEPAGES_VERSION_CACHE_KEY = "language_homepages_version"
+
+
+# The translations of each page (ids and urls of all pages of its translation group)
+# are shared across requests through the django cache. Entries are invalidated by
+# the signal handlers at the bottom of this module, so they may live forever.
+TRANSLATIONS_CACHE_TIMEOUT = None
+# Cache version of the translations and language switchers. Replacing it drops all
+# of them at once, e.g. after the database got reset.
+TRANSLATIONS_VERSION_CACHE_KEY = "translations_version"
+
+# Rendered once per translation group and active language and then served from the
+# cache. Should only depend on ``i18n_pages`` and ``i18n_pages_no_translation``.
+LANGUAGE_SWITCHER_TEMPLATE = "cms/includes/language_switcher.html"
+
+
+def get_language_homepages_version() -> str:
+    return get_cache_version(LANGUAGE_HOMEPAGES_VERSION_CACHE_KEY)
+
+
+async def aget_language_homepages_version() -> str:
+    """Async version of ``get_language_homepages_version``."""
+    return await aget_cache_version(LANGUAGE_HOMEPAGES_VERSION_CACHE_KEY)
+
+
+def get_language_homepages(reload=False) -> dict:
+    """Returns the (cached) map of language homepage paths to language codes.
+
+    Costs a single cache lookup as long as no language homepage changes. ``reload``
+    loads the map of this process anew, e.g. when a homepage is missing.
+    """
+    global _language_homepages
+    version = get_language_homepages_version()
+    loaded = _language_homepages
+    if reload or loaded is None or loaded[0] != version:
+        loaded = _language_homepages = (
+            version,
+            dict(
+                Page.objects.filter(depth=LANGUAGE_HOMEPAGE_DEPTH).values_list(
+                    "path", "slug"
+                )
+            ),
+        )
+    return loaded[1]
+
+
+def reset_language_homepages(**kwargs):
+    """Makes all processes reload their language homepage map on next access.
+
+    The version is bumped once the transaction commits, so no process can load the
+    map of the old pages for the new version.
+    """
+    global _language_homepages
+    _language_homepages = None
+    bump_cache_version(LANGUAGE_HOMEPAGES_VERSION_CACHE_KEY)
+
+
+async def aget_language_homepages(reload=False) -> dict:
+    """Async version of ``get_language_homepages``."""
+    global _language_homepages
+    version = await aget_language_homepages_version()
+    loaded = _language_homepages
+    if reload or loaded is None or loaded[0] != version:
+        homepages = Page.objects.filter(depth=LANGUAGE_HOMEPAGE_DEPTH)
+        loaded = _language_homepages = (
+            version,
+            {path: slug async for path, slug in homepages.values_list("path", "slug")},
+        )
+    return loaded[1]
+
+
+def _get_homepage_path(page: Page) -> str:
+    # The treebeard path of a page starts with the path of its language homepage,
+    # so the language can be looked up without hitting the database.
+    return page.path[: Page.steplen * LANGUAGE_HOMEPAGE_DEPTH]
+
+
+def get_page_language(page: Page, language_homepages: dict = None) -> str:
+    """This returns the language code for any page.
+
+    Pass the ``language_homepages`` map when looking up the language of many pages,
+    to only check its version once.
+    """
+    if page.depth == LANGUAGE_HOMEPAGE_DEPTH:
+        return page.slug
+    homepage_path = _get_homepage_path(page)
+    if language_homepages is None:
+        language_homepages = get_language_homepages()
+    language = language_homepages.get(homepage_path)
+    if language is None and page.depth >= LANGUAGE_HOMEPAGE_DEPTH:
+        # The homepage might have been created (e.g. in this transaction) after we
+        # loaded the map. Reload it once.
+        language = get_language_homepages(reload=True).get(homepage_path)
+    if language is None:
+        # Not located below a language homepage (or not saved yet). Look through
+        # ancestors of this page like we always did.
+        language_homepage = page.get_ancestors(inclusive=True).get(
+            depth=LANGUAGE_HOMEPAGE_DEPTH
+        )
+        # The slug of language homepages should always be set to the language
+        # code
+        language = language_homepage.slug
+    return language
+
+
+async def aget_page_language(page: Page, language_homepages: dict = None) -> str:
+    """Async version of ``get_page_language``."""
+    if page.depth == LANGUAGE_HOMEPAGE_DEPTH:
+        return page.slug
+    homepage_path = _get_homepage_path(page)
+    if language_homepages is None:
+        language_homepages = await aget_language_homepages()
+    language = language_homepages.get(homepage_path)
+    if language is None and page.depth >= LANGUAGE_HOMEPAGE_DEPTH:
+        language = (await aget_language_homepages(reload=True)).get(homepage_path)
+    if language is None:
+        language_homepage = await page.get_ancestors(inclusive=True).aget(
+            depth=LANGUAGE_HOMEPAGE_DEPTH
+        )
+        language = language_homepage.slug
+    return language
+
+
+# content type id -> model class, so specific pages can be loaded without the
+# (sync only) caching of ``ContentType.objects.get_for_id``.
+_content_type_models = {}
+
+
+async def aget_specific(page: Page) -> Page:
+    """Async version of ``page.specific``."""
+    model = _content_type_models.get(page.content_type_id)
+    if model is None:
+        content_type = await ContentType.objects.aget(pk=page.content_type_id)
+        model = _content_type_models[page.content_type_id] = content_type.model_class()
+    if model is None or isinstance(page, model):
+        return page
+    return await model.objects.aget(pk=page.pk)
+
+
+def get_specific_pages(pages: Iterable[Page]) -> List[Page]:
+    """The specific instances of the given pages, one query per content type.
+
+    Pages which are specific already are returned as they are.
+    """
+    pages = list(pages)
+    ids_by_content_type = defaultdict(list)
+    for page in pages:
+        if type(page) is Page:
+            ids_by_content_type[page.content_type_id].append(page.pk)
+    specific_pages = {}
+    for content_type_id, ids in ids_by_content_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            # the model of the page is gone
+            continue
+        specific_pages.update(model.objects.in_bulk(ids))
+    return [specific_pages.get(page.pk, page) for page in pages]
+
+
+class SpecificPageLoader:
+    """Collects page ids and loads their specific instances in bulk.
+
+    ``add`` returns a lazy object. The first access of any of them loads all pages
+    collected until then, one query per content type. Used for the ``page`` entries
+    of ``i18n_pages``, so a listing of many pages does not need a query per page.
+    """
+
+    def __init__(self):
+        self.page_ids = set()
+        self.pages = {}
+
+    def add(self, page_id: int) -> SimpleLazyObject:
+        self.page_ids.add(page_id)
+        return SimpleLazyObject(lambda: self.get(page_id))
+
+    def get(self, page_id: int) -> Page:
+        if page_id not in self.pages:
+            self._load()
+        return self.pages[page_id]
+
+    def _load(self):
+        page_ids = self.page_ids - self.pages.keys()
+        self.pages.update(
+            (page.pk, page) for page in Page.objects.filter(pk__in=page_ids).specific()
+        )
+        for page_id in page_ids:
+            # deleted in the meantime
+            self.pages.setdefault(page_id, None)
+
+
+class TranslatablePageQuerySet(PageQuerySet):
+    """QuerySet for translatable pages."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetch_translations = False
+        self._translations_request = None
+
+    def in_language(self, language):
+        """Pages of the given language. A simple indexed filter."""
+        return self.filter(language=language)
+
+    def with_translations(self, request=None):
+        """Resolves the translations of all pages in a constant number of queries.
+
+        Useful for listings, which render a language switcher for each item::
+
+            TeamMemberPage.objects.live().specific().with_translations(request)
+        """
+        clone = self._chain()
+        clone._prefetch_translations = True
+        clone._translations_request = request
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_translations = self._prefetch_translations
+        clone._translations_request = self._translations_request
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and self._prefetch_translations:
+            prefetch_translations(
+                self._result_cache, request=self._translations_request
+            )
+
+
+TranslatablePageManager = PageManager.from_queryset(TranslatablePageQuerySet)
+
+
+class PageTranslationQuerySet(models.QuerySet):
+    def of_pages(self, page_ids):
+        """All translations of the given pages, in a single query."""
+        return self.filter(
+            group__in=PageTranslation.objects.filter(page__in=page_ids).values("group")
+        )
+
+
+class PageTranslation(models.Model):
+    """Puts all language versions of a page into one translation group.
+
+    There is one row per page, so all translations of a page can be fetched with a
+    single indexed query, no matter how many languages we support.
+    """
+
+    page = models.OneToOneField(
+        Page, on_delete=models.CASCADE, related_name="translation"
+    )
+    group = models.UUIDField(default=uuid.uuid4)
+    language = models.CharField(max_length=7)
+
+    objects = PageTranslationQuerySet.as_manager()
+
+    class Meta:
+        # Only one page per language in each group. This also is the index used to
+        # look up the translations of a group.
+        unique_together = ("group", "language")
+
+    def __str__(self):
+        return "{} ({})".format(self.page_id, self.language)
+
+
+def add_to_translation_group(page: Page, group: uuid.UUID = None) -> uuid.UUID:
+    """Adds the page to a translation group (a new one by default).
+
+    The page which had the same language in that group so far ends up in a group of
+    its own.
+
+    Returns:
+        UUID: The translation group the page belongs to now.
+    """
+    group = group or uuid.uuid4()
+    language = get_page_language(page)
+    previous = PageTranslation.objects.filter(group=group, language=language).exclude(
+        page=page
+    )
+    affected_page_ids = {page.pk}
+    affected_page_ids.update(previous.values_list("page_id", flat=True))
+    previous.update(group=uuid.uuid4())
+    PageTranslation.objects.update_or_create(
+        page=page, defaults={"group": group, "language": language}
+    )
+    invalidate_translations(affected_page_ids)
+    return group
+
+
+def link_translations(page: Page, translated_page: Page) -> uuid.UUID:
+    """Puts ``translated_page`` into the translation group of ``page``."""
+    page_translation = PageTranslation.objects.filter(page=page).first()
+    if page_translation:
+        group = page_translation.group
+    else:
+        group = add_to_translation_group(page)
+    return add_to_translation_group(translated_page, group)
+
 
 class TranslatablePageMixin(models.Model):
-    """Mixin for translatable pages""""
-    # One link for each alternative language
+    """Mixin for translatable pages"""
+
+    # Link to the english version. Saving it puts both pages into the same translation
+    # group (see ``PageTranslation``). Other languages can be added to the group with
+    # ``link_translations``.
     # These should only be used on the main language page (german)
     english_link = models.ForeignKey(
         Page,
@@ -32,10 +359,20 @@ class TranslatablePageMixin(models.Model):
         ),
     )
 
+    # The language of the page, kept in sync on save and move. Existing pages can be
+    # filled with the ``backfill_page_language`` management command.
+    language = models.CharField(max_length=7, db_index=True, editable=False)
+
+    objects = TranslatablePageManager()
+
     panels = [PageChooserPanel("english_link")]
 
     @cached_property
     def i18n_pages(self) -> OrderedDict:
+        """The ``i18n_pages`` of this page, see ``get_i18n_pages``."""
+        return self.get_i18n_pages()
+
+    def get_i18n_pages(self, request=None) -> OrderedDict:
         """Outputs all the translated pages for this page and some useful infos.
 
         Returns:
@@ -54,19 +391,41 @@ class TranslatablePageMixin(models.Model):
                     }
                 }
         """
-        # keep languages sorted alphabetically.
-        languages = sorted(
-            [("de", self.get_german_page()), ("en", self.get_english_page())],
-            key=lambda x: x[0],
-        )
-        pages = OrderedDict(languages)
+        if "i18n_pages" not in self.__dict__:
+            translations = get_translations([self], request=request)[self.pk]
+            self.__dict__["i18n_pages"] = self._build_i18n_pages(translations)
+        return self.__dict__["i18n_pages"]
+
+    def _build_i18n_pages(
+        self, translations: dict, loader: SpecificPageLoader = None
+    ) -> OrderedDict:
+        """Builds the ``i18n_pages`` data out of the (cached) translations.
+
+        The pages of other languages are only loaded from the database when their
+        ``page`` entry is actually accessed. Pages sharing a ``loader`` are loaded
+        together.
+        """
+        if loader is None:
+            loader = SpecificPageLoader()
+        # for ``get_translation``, which returns the pages themselves
+        self._i18n_loader = loader
+        self._i18n_page_ids = {}
+        self.translation_group = translations["group"]
+        languages = translations["languages"]
         i18n: OrderedDict = OrderedDict()
-        for lang_code, page in pages.items():
+        # keep languages sorted alphabetically.
+        for lang_code in sorted(languages):
+            translated = languages[lang_code]
             lang_data = {}
-            lang_data["page"] = page
+            lang_data["page"] = None
             lang_data["url"] = None
-            if page:
-                lang_data["url"] = page.get_url()
+            if translated:
+                self._i18n_page_ids[lang_code] = translated["id"]
+                if translated["id"] == self.pk:
+                    lang_data["page"] = self
+                else:
+                    lang_data["page"] = loader.add(translated["id"])
+                lang_data["url"] = translated["url"]
             lang_data["is_active"] = translation.get_language() == lang_code
             lang_data.update(settings.OUR_I18N_METADATA[lang_code])
             i18n[lang_code] = lang_data
@@ -74,43 +433,571 @@ class TranslatablePageMixin(models.Model):
 
     def get_context(self, request):
         context = super().get_context(request)
-        context["i18n_pages"] = self.i18n_pages
+        i18n_pages = self.get_i18n_pages(request)
+        context["i18n_pages"] = i18n_pages
+        context["i18n_pages_no_translation"] = self._has_no_translation(i18n_pages)
+        context["language_switcher"] = self.render_language_switcher(request)
+        return context
+
+    @staticmethod
+    def _has_no_translation(i18n_pages: OrderedDict) -> bool:
         # no translation means that we have no URLs or only a single one to redirect
         # to.
-        context["i18n_pages_no_translation"] = (
-            len([trans["url"] for trans in self.i18n_pages.values() if trans["url"]])
-            <= 1
+        return len([trans["url"] for trans in i18n_pages.values() if trans["url"]]) <= 1
+
+    def render_language_switcher(self, request=None) -> str:
+        """Returns the rendered language switcher for this page.
+
+        The rendered html is cached per translation group, active language and the
+        version of the translation group, which changes whenever its translations
+        get invalidated.
+        """
+        i18n_pages = self.get_i18n_pages(request)
+        group = self.translation_group or "page-{}".format(self.pk)
+        site = _get_current_site(request)
+        key = "i18n_switcher:{}:{}:{}:{}".format(
+            site.pk if site else "",
+            group,
+            translation.get_language(),
+            get_language_switcher_version(group),
         )
-        return context
+        html = cache.get(key)
+        if html is None:
+            html = render_to_string(
+                LANGUAGE_SWITCHER_TEMPLATE,
+                {
+                    "i18n_pages": i18n_pages,
+                    "i18n_pages_no_translation": self._has_no_translation(i18n_pages),
+                },
+            )
+            cache.set(key, html, timeout=TRANSLATIONS_CACHE_TIMEOUT)
+        return html
 
     def get_language(self):
         """This returns the language code for this page."""
-        # Look through ancestors of this page for its language homepage
-        # The language homepage is located at depth 3
-        language_homepage = self.get_ancestors(inclusive=True).get(depth=3)
-        # The slug of language homepages should always be set to the language code
-        return language_homepage.slug
-
-    def get_german_page(self):
-        """returns the german version of this page"""
-        language = self.get_language()
+        return self.language or get_page_language(self)
 
-        if language == "de":
+    def get_translation(self, language):
+        """returns the version of this page in the given language"""
+        if language == self.get_language():
             return self
-        elif language == "en":
-            german_page = type(self).objects.filter(english_link=self).first()
-            if german_page:
-                return german_page.specific
+        if "i18n_pages" in self.__dict__:
+            # prefetched, e.g. by ``with_translations``. Loaded in bulk. Not the lazy
+            # ``page`` entry, it would hide a translation deleted in the meantime.
+            page_id = self._i18n_page_ids.get(language)
+            if page_id == self.pk:
+                return self
+            return self._i18n_loader.get(page_id) if page_id else None
+        page_translation = (
+            PageTranslation.objects.of_pages([self.pk])
+            .filter(language=language)
+            .select_related("page")
+            .first()
+        )
+        if page_translation:
+            return page_translation.page.specific
         return None
 
+    def get_german_page(self):
+        """returns the german version of this page"""
+        return self.get_translation("de")
+
     def get_english_page(self):
         """returns the english version of this page"""
-        german_page = self.get_german_page()
+        return self.get_translation("en")
+
+    # Async counterparts of the methods above for ASGI deployments. They use Django's
+    # async ORM, so concurrent requests do not have to wait for each other. Note that
+    # the ``page`` entries of ``i18n_pages`` are loaded synchronously, use
+    # ``aget_translation`` to get the translated pages in async code.
+
+    async def ai18n_pages(self, request=None) -> OrderedDict:
+        """Async version of ``get_i18n_pages``."""
+        if "i18n_pages" not in self.__dict__:
+            translations = (await aget_translations([self], request=request))[self.pk]
+            self.__dict__["i18n_pages"] = self._build_i18n_pages(translations)
+        return self.__dict__["i18n_pages"]
 
-        if german_page and german_page.english_link:
-            return german_page.english_link.specific
+    async def aget_language(self):
+        """Async version of ``get_language``."""
+        return self.language or await aget_page_language(self)
+
+    async def aget_translation(self, language):
+        """Async version of ``get_translation``."""
+        if language == await self.aget_language():
+            return self
+        page_translation = (
+            await PageTranslation.objects.of_pages([self.pk])
+            .filter(language=language)
+            .select_related("page")
+            .afirst()
+        )
+        if page_translation:
+            return await aget_specific(page_translation.page)
         return None
 
+    async def aget_german_page(self):
+        """Async version of ``get_german_page``."""
+        return await self.aget_translation("de")
+
+    async def aget_english_page(self):
+        """Async version of ``get_english_page``."""
+        return await self.aget_translation("en")
+
+    def _sync_translation_group(self):
+        """Keeps the translation group of this page in sync with ``english_link``.
+
+        Setting ``english_link`` puts the english page into the group of this page,
+        removing it moves the english page into a group of its own. Saves which do
+        not change ``english_link`` keep english pages added by ``link_translations``.
+        """
+        english_link_removed = self.__dict__.pop("_english_link_removed", False)
+        page_translation = PageTranslation.objects.filter(page=self).first()
+        if page_translation:
+            group = page_translation.group
+        else:
+            group = add_to_translation_group(self)
+        english_page_id = (
+            PageTranslation.objects.filter(group=group, language="en")
+            .values_list("page_id", flat=True)
+            .first()
+        )
+        if self.english_link_id:
+            if english_page_id != self.english_link_id:
+                add_to_translation_group(self.english_link, group)
+        elif english_link_removed and english_page_id and self.get_language() == "de":
+            # the english page got unlinked. It gets a group of its own.
+            add_to_translation_group(Page.objects.get(pk=english_page_id))
+
     class Meta:
         abstract = True
 
+
+def _get_current_site(request):
+    """The site used to generate urls. Wagtail caches it on the request.
+
+    The site root paths are cached on the request by the first ``get_url(request)``.
+    """
+    if request is None:
+        return None
+    return Site.find_for_request(request)
+
+
+def _translations_cache_key(page_id, site=None) -> str:
+    # urls are relative to the current site, so they are cached per site.
+    return "i18n_pages:{}:{}".format(site.pk if site else "", page_id)
+
+
+def _language_switcher_version_key(group) -> str:
+    return "i18n_switcher_version:{}".format(group)
+
+
+def get_translations_version() -> str:
+    return get_cache_version(TRANSLATIONS_VERSION_CACHE_KEY)
+
+
+async def aget_translations_version() -> str:
+    """Async version of ``get_translations_version``."""
+    return await aget_cache_version(TRANSLATIONS_VERSION_CACHE_KEY)
+
+
+def get_language_switcher_version(group) -> str:
+    """Returns the current version of the language switcher of a translation group.
+
+    Versions are random, so switchers rendered before the version got evicted from
+    the cache are never served again.
+    """
+    key = _language_switcher_version_key(group)
+    translations_version = get_translations_version()
+    version = cache.get(key, version=translations_version)
+    if version is None:
+        cache.add(
+            key,
+            uuid.uuid4().hex,
+            timeout=TRANSLATIONS_CACHE_TIMEOUT,
+            version=translations_version,
+        )
+        version = cache.get(key, version=translations_version)
+    return version
+
+
+def _group_translations(pages, page_translations, page_languages) -> dict:
+    """Groups the translated pages by the pages, see ``resolve_translations``."""
+    groups = {}
+    group_members = defaultdict(dict)
+    for page_translation in page_translations:
+        group = page_translation.group
+        groups[page_translation.page_id] = group
+        group_members[group][page_translation.language] = page_translation.page
+
+    resolved = {}
+    for page in pages:
+        group = groups.get(page.pk)
+        translated_pages = dict.fromkeys(settings.OUR_I18N_METADATA)
+        resolved[page.pk] = (group, translated_pages)
+        if group:
+            members = group_members[group]
+        elif page.pk in page_languages:
+            # not part of a translation group (yet)
+            members = {page_languages[page.pk]: page}
+        else:
+            # above the language homepages
+            members = {}
+        for lang_code, translated_page in members.items():
+            if lang_code in translated_pages:
+                translated_pages[lang_code] = translated_page
+    return resolved
+
+
+def resolve_translations(pages: List[Page]) -> dict:
+    """Resolves the translated pages for all given pages in bulk.
+
+    Instead of ~6 queries per page this needs a single query for all pages, no matter
+    how many pages are passed in or how many languages we support.
+
+    Returns:
+        dict: Maps the page ids to their translation group and the translated pages,
+            e.g. ``(UUID(...), {"de": <Page>, "en": None})``.
+    """
+    page_translations = PageTranslation.objects.of_pages([page.pk for page in pages])
+    language_homepages = get_language_homepages()
+    page_languages = {
+        page.pk: get_page_language(page, language_homepages)
+        for page in pages
+        if page.depth >= LANGUAGE_HOMEPAGE_DEPTH
+    }
+    return _group_translations(
+        pages, page_translations.select_related("page"), page_languages
+    )
+
+
+async def aresolve_translations(pages: List[Page]) -> dict:
+    """Async version of ``resolve_translations``."""
+    page_translations = PageTranslation.objects.of_pages([page.pk for page in pages])
+    language_homepages = await aget_language_homepages()
+    page_languages = {
+        page.pk: await aget_page_language(page, language_homepages)
+        for page in pages
+        if page.depth >= LANGUAGE_HOMEPAGE_DEPTH
+    }
+    return _group_translations(
+        pages,
+        [
+            page_translation
+            async for page_translation in page_translations.select_related("page")
+        ],
+        page_languages,
+    )
+
+
+def _serialize_translations(resolved: dict, request, site):
+    """Turns resolved translations into the (cacheable) ids and urls.
+
+    Returns:
+        tuple: The translations by page id and the entries to cache.
+    """
+    translations = {}
+    to_cache = {}
+    for page_id, (group, translated_pages) in resolved.items():
+        languages = {
+            lang_code: (
+                {
+                    "id": translated.pk,
+                    "url": translated.get_url(request=request, current_site=site),
+                }
+                if translated
+                else None
+            )
+            for lang_code, translated in translated_pages.items()
+        }
+        page_translations = {
+            "group": str(group) if group else None,
+            "languages": languages,
+        }
+        translations[page_id] = page_translations
+        # all pages of the translation group share the same translations
+        to_cache[_translations_cache_key(page_id, site)] = page_translations
+        for translated in languages.values():
+            if translated:
+                key = _translations_cache_key(translated["id"], site)
+                to_cache[key] = page_translations
+    return translations, to_cache
+
+
+def get_translations(pages: List[Page], request=None) -> dict:
+    """Returns the ids and urls of the translations of all given pages.
+
+    Translations are served from the cache. Missing ones are resolved in bulk and
+    cached for every page of their translation group.
+
+    Returns:
+        dict: Maps the page ids to the translations of the page::
+
+            {
+                "group": "7b0d5a8e-...",
+                "languages": {
+                    "de": {"id": 3, "url": "/de/meine-seite/"},
+                    "en": None,
+                },
+            }
+    """
+    site = _get_current_site(request)
+    version = get_translations_version()
+    keys = {page.pk: _translations_cache_key(page.pk, site) for page in pages}
+    cached = cache.get_many(keys.values(), version=version)
+    translations = {}
+    missing = []
+    for page in pages:
+        if keys[page.pk] in cached:
+            translations[page.pk] = cached[keys[page.pk]]
+        else:
+            missing.append(page)
+
+    if missing:
+        resolved, to_cache = _serialize_translations(
+            resolve_translations(missing), request, site
+        )
+        translations.update(resolved)
+        cache.set_many(to_cache, timeout=TRANSLATIONS_CACHE_TIMEOUT, version=version)
+    return translations
+
+
+async def aget_translations(pages: List[Page], request=None) -> dict:
+    """Async version of ``get_translations``."""
+    # Wagtail only offers sync lookups of sites and site root paths. They use the
+    # database and the cache, so they run in the thread sensitive thread, whose
+    # database connection is closed at the end of the request like any other.
+    site = await sync_to_async(_get_current_site)(request)
+    version = await aget_translations_version()
+    keys = {page.pk: _translations_cache_key(page.pk, site) for page in pages}
+    cached = await cache.aget_many(keys.values(), version=version)
+    translations = {}
+    missing = []
+    for page in pages:
+        if keys[page.pk] in cached:
+            translations[page.pk] = cached[keys[page.pk]]
+        else:
+            missing.append(page)
+
+    if missing:
+        resolved, to_cache = await sync_to_async(_serialize_translations)(
+            await aresolve_translations(missing), request, site
+        )
+        translations.update(resolved)
+        await cache.aset_many(
+            to_cache, timeout=TRANSLATIONS_CACHE_TIMEOUT, version=version
+        )
+    return translations
+
+
+def invalidate_translations(page_ids: Iterable[int], on_commit=True):
+    """Removes the cached translations of the given pages and their translations.
+
+    This also invalidates the rendered language switchers of their translation groups.
+    The affected pages and groups are collected right away, the entries are removed
+    once the transaction commits. Until then concurrent requests still see the old
+    rows and might cache them again. ``on_commit=False`` removes them right away, e.g.
+    inside a transaction which is rolled back.
+    """
+    sites = [None] + list(Site.objects.all())
+    version = get_translations_version()
+    page_ids = set(page_ids)
+    groups = {"page-{}".format(page_id) for page_id in page_ids}
+    # the current members of the translation groups
+    for page_id, group in PageTranslation.objects.of_pages(page_ids).values_list(
+        "page_id", "group"
+    ):
+        page_ids.add(page_id)
+        groups.add(str(group))
+    # the members they had when the translations got cached
+    keys = {
+        _translations_cache_key(page_id, site) for page_id in page_ids for site in sites
+    }
+    for page_translations in cache.get_many(keys, version=version).values():
+        if page_translations["group"]:
+            groups.add(page_translations["group"])
+        for translated in page_translations["languages"].values():
+            if translated:
+                page_ids.add(translated["id"])
+    stale_keys = {
+        _translations_cache_key(page_id, site) for page_id in page_ids for site in sites
+    } | {_language_switcher_version_key(group) for group in groups}
+    if on_commit:
+        transaction.on_commit(lambda: cache.delete_many(stale_keys, version=version))
+    else:
+        cache.delete_many(stale_keys, version=version)
+
+
+def prefetch_translations(pages: Iterable[Page], request=None) -> List[Page]:
+    """Fills ``i18n_pages`` of all given translatable pages in bulk.
+
+    Returns:
+        list: The translatable pages which got their ``i18n_pages`` filled.
+    """
+    pages = [
+        page
+        for page in pages
+        if isinstance(page, TranslatablePageMixin) and "i18n_pages" not in page.__dict__
+    ]
+    translations = get_translations(pages, request=request)
+    # the translated pages of all pages are loaded together
+    loader = SpecificPageLoader()
+    for page in pages:
+        # this is what the cached_property would do on first access
+        page.__dict__["i18n_pages"] = page._build_i18n_pages(
+            translations[page.pk], loader
+        )
+    return pages
+
+
+@receiver(pre_save)
+def _detect_english_link_removal_on_page_save(
+    sender, instance, update_fields=None, **kwargs
+):
+    """Remembers whether the save removes ``english_link``.
+
+    Only then the english page leaves the translation group. Saves with a link cost no
+    query.
+    """
+    if not isinstance(instance, TranslatablePageMixin) or instance.pk is None:
+        return
+    if instance.english_link_id:
+        return
+    if update_fields is not None and "english_link" not in update_fields:
+        return
+    old_english_link_id = (
+        type(instance)
+        ._base_manager.filter(pk=instance.pk)
+        .values_list("english_link_id", flat=True)
+        .first()
+    )
+    instance._english_link_removed = old_english_link_id is not None
+
+
+@receiver(post_save)
+def _sync_translation_group_on_page_save(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if not isinstance(instance, TranslatablePageMixin):
+        return
+    if created or update_fields is None or "english_link" in update_fields:
+        instance._sync_translation_group()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _reset_language_homepages_on_page_change(sender, instance, **kwargs):
+    """Language homepages (and their slugs) only live at the top of the tree."""
+    if isinstance(instance, Page) and instance.depth <= LANGUAGE_HOMEPAGE_DEPTH:
+        reset_language_homepages()
+
+
+@receiver(post_page_move)
+def _reset_language_homepages_on_page_move(sender, instance, **kwargs):
+    """Moving pages around might change the paths of language homepages."""
+    reset_language_homepages()
+
+
+# Only changes to these fields change the cached translations. Wagtail saves drafts
+# with ``update_fields``, which leaves the cache alone.
+TRANSLATIONS_CACHE_FIELDS = {"english_link", "slug", "url_path"}
+
+
+@receiver(pre_save)
+def _detect_url_path_change_on_page_save(
+    sender, instance, update_fields=None, **kwargs
+):
+    """Remembers whether the save changes the urls of the descendants.
+
+    Wagtail sets the new ``url_path`` before saving, the database still has the old
+    one. Only pages with children need to know, so other saves cost no query.
+    """
+    if not isinstance(instance, Page) or instance.pk is None or not instance.numchild:
+        return
+    if update_fields is not None and "url_path" not in update_fields:
+        return
+    old_url_path = (
+        Page.objects.filter(pk=instance.pk).values_list("url_path", flat=True).first()
+    )
+    instance._url_path_changed = old_url_path != instance.url_path
+
+
+@receiver(post_save)
+def _invalidate_translations_on_page_save(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    """Publishing and unpublishing pages also saves them."""
+    if not isinstance(instance, Page):
+        return
+    if update_fields is not None and not TRANSLATIONS_CACHE_FIELDS.intersection(
+        update_fields
+    ):
+        return
+    page_ids = {instance.pk}
+    # the new english page. The old one is part of the cached translations.
+    if getattr(instance, "english_link_id", None):
+        page_ids.add(instance.english_link_id)
+    # A changed slug also changes the urls of all descendants. Publishing a page
+    # saves it, too, so only expand when the url really changed.
+    if instance.__dict__.pop("_url_path_changed", False):
+        page_ids.update(
+            Page.objects.descendant_of(instance).values_list("pk", flat=True)
+        )
+    invalidate_translations(page_ids)
+
+
+@receiver(post_delete)
+def _invalidate_translations_on_page_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        invalidate_translations([instance.pk])
+
+
+@receiver(post_page_move)
+def _invalidate_translations_on_page_move(sender, instance, **kwargs):
+    """Moving a page changes the urls of the page and all its descendants."""
+    invalidate_translations(
+        Page.objects.descendant_of(instance, inclusive=True).values_list(
+            "pk", flat=True
+        )
+    )
+
+
+@receiver(post_page_move)
+def _update_translation_groups_on_page_move(sender, instance, **kwargs):
+    """Pages moved to another language leave their translation groups."""
+    page = Page.objects.get(pk=instance.pk)
+    moved = PageTranslation.objects.filter(page__path__startswith=page.path).exclude(
+        language=get_page_language(page)
+    )
+    for page_translation in moved.select_related("page"):
+        add_to_translation_group(page_translation.page)
+
+
+def get_translatable_page_models() -> list:
+    return [
+        model for model in apps.get_models() if issubclass(model, TranslatablePageMixin)
+    ]
+
+
+@receiver(pre_save)
+def _set_language_on_page_save(sender, instance, **kwargs):
+    if not isinstance(instance, TranslatablePageMixin):
+        return
+    if instance.depth == LANGUAGE_HOMEPAGE_DEPTH and instance.language:
+        # e.g. ``HomePage``, which has its own language field
+        return
+    if instance.depth >= LANGUAGE_HOMEPAGE_DEPTH:
+        instance.language = get_page_language(instance)
+
+
+@receiver(post_page_move)
+def _update_language_on_page_move(sender, instance, **kwargs):
+    """Moved pages (and their descendants) might now belong to another language."""
+    page = Page.objects.get(pk=instance.pk)
+    if page.depth <= LANGUAGE_HOMEPAGE_DEPTH:
+        return
+    language = get_page_language(page)
+    for model in get_translatable_page_models():
+        model.objects.filter(path__startswith=page.path).exclude(
+            language=language
+        ).update(language=language)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from wagtail.core.models import Page
+
+from codista.cms.models import LANGUAGE_HOMEPAGE_DEPTH, get_translatable_page_models
+
+
+class Command(BaseCommand):
+    """Fills the ``language`` field of all translatable pages.
+
+    Pages are updated in bulk with one query per language and page model: every page
+    below a language homepage gets the language of that homepage.
+    """
+
+    help = "Fills the language field of all translatable pages."
+    requires_system_checks = False
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        homepages = Page.objects.filter(depth=LANGUAGE_HOMEPAGE_DEPTH).values_list(
+            "path", "slug"
+        )
+        for path, language in homepages:
+            for model in get_translatable_page_models():
+                updated = (
+                    model.objects.filter(
+                        path__startswith=path, depth__gt=LANGUAGE_HOMEPAGE_DEPTH
+                    )
+                    .exclude(language=language)
+                    .update(language=language)
+                )
+                if verbosity > 0:
+                    self.stdout.write(
+                        "{language}: {count} {model} updated".format(
+                            language=language,
+                            count=updated,
+                            model=model._meta.verbose_name_plural,
+                        )
+                    )
@@ -0,0 +1,14 @@
+"""Helpers shared by the benchmark commands.
+
+Lives next to the management commands, e.g. ``<app>/management/benchmark.py``. Used
+by ``benchmark_translations`` and ``benchmark_page_tree``.
+"""
+
+import math
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the given values."""
+    values = sorted(values)
+    index = max(0, math.ceil(len(values) * percent / 100) - 1)
+    return values[index]
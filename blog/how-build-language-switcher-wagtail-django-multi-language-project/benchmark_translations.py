@@ -0,0 +1,229 @@
+import json
+import math
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+from wagtail.core.models import Page, Site
+
+from codista.cms.models import (
+    TranslatablePageMixin,
+    invalidate_translations,
+    reset_language_homepages,
+)
+
+from ..benchmark import percentile
+
+LANGUAGES = ("de", "en")
+BENCHMARK_HOSTNAME = "benchmark.localhost"
+
+# name -> callable(page, request). Every scenario gets a freshly loaded page.
+SCENARIOS = {
+    "get_context": lambda page, request: page.get_context(request),
+    "i18n_pages": lambda page, request: page.get_i18n_pages(request),
+    "get_language": lambda page, request: page.get_language(),
+    "get_german_page": lambda page, request: page.get_german_page(),
+    "get_english_page": lambda page, request: page.get_english_page(),
+}
+
+
+class Rollback(Exception):
+    """Raised to throw away the synthetic page tree."""
+
+
+class Command(BaseCommand):
+    """DEV ONLY: Benchmarks the translation lookups of ``TranslatablePageMixin``.
+
+    Builds a synthetic german/english page tree inside a transaction (which gets
+    rolled back afterwards) and measures queries, latency and memory allocations of
+    each lookup per page. Results can be saved as baseline and compared later on.
+    """
+
+    help = "DEV ONLY: Benchmarks the translation lookups of translatable pages."
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            default="cms.DefaultPage",
+            help="Translatable page model used for the synthetic tree.",
+        )
+        parser.add_argument(
+            "--pages", type=int, default=200, help="Pages per language."
+        )
+        parser.add_argument(
+            "--depth", type=int, default=3, help="Levels below the language homepages."
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=100,
+            help="Number of pages per language to benchmark.",
+        )
+        parser.add_argument("--save-baseline", help="Write the results to this file.")
+        parser.add_argument("--compare", help="Compare the results to this baseline.")
+
+    def _build_tree(self, model, pages_per_language, depth):
+        """Creates the synthetic tree and returns the ids of the pages per language."""
+        root = Page.get_first_root_node()
+        benchmark_root = root.add_child(
+            instance=Page(title="Benchmark", slug="benchmark-{}".format(uuid.uuid4()))
+        )
+        Site.objects.create(
+            hostname=BENCHMARK_HOSTNAME, port=80, root_page=benchmark_root
+        )
+        # spread the pages evenly across the levels
+        branching = max(2, math.ceil(pages_per_language ** (1 / max(depth, 1))))
+        page_ids = {}
+        for language in LANGUAGES:
+            homepage = benchmark_root.add_child(
+                instance=model(title="Home {}".format(language), slug=language)
+            )
+            page_ids[language] = []
+            parents = [homepage]
+            while len(page_ids[language]) < pages_per_language:
+                children = []
+                for parent in parents:
+                    for __ in range(branching):
+                        if len(page_ids[language]) >= pages_per_language:
+                            break
+                        number = len(page_ids[language])
+                        child = parent.add_child(
+                            instance=model(
+                                title="Page {} {}".format(language, number),
+                                slug="page-{}".format(number),
+                            )
+                        )
+                        page_ids[language].append(child.pk)
+                        children.append(child)
+                parents = children
+        # german pages link their english counterparts
+        for german_id, english_id in zip(page_ids["de"], page_ids["en"]):
+            german_page = model.objects.get(pk=german_id)
+            german_page.english_link_id = english_id
+            german_page.save()
+        return page_ids
+
+    def _get_request(self):
+        """A new request for each measurement, like in production."""
+        return RequestFactory().get("/", SERVER_NAME=BENCHMARK_HOSTNAME)
+
+    def _measure(self, model, page_ids, warm):
+        """Runs all scenarios for all pages and collects the raw numbers."""
+        results = {
+            name: {"ms": [], "queries": [], "alloc_kb": []} for name in SCENARIOS
+        }
+        for language, ids in page_ids.items():
+            with translation.override(language):
+                for page_id in ids:
+                    for name, scenario in SCENARIOS.items():
+                        numbers = results[name]
+                        if warm:
+                            page = model.objects.get(pk=page_id)
+                            scenario(page, self._get_request())
+                        else:
+                            invalidate_translations([page_id], on_commit=False)
+                        # latency and queries
+                        page = model.objects.get(pk=page_id)
+                        request = self._get_request()
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            scenario(page, request)
+                            numbers["ms"].append((time.perf_counter() - start) * 1000)
+                        numbers["queries"].append(len(queries))
+                        # allocations. Measured separately, tracemalloc is slow.
+                        if not warm:
+                            invalidate_translations([page_id], on_commit=False)
+                        page = model.objects.get(pk=page_id)
+                        request = self._get_request()
+                        tracemalloc.start()
+                        scenario(page, request)
+                        __, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                        numbers["alloc_kb"].append(peak / 1024)
+        return results
+
+    def _summarize(self, results):
+        summary = {}
+        for name, numbers in results.items():
+            summary[name] = {
+                "queries": sum(numbers["queries"]) / len(numbers["queries"]),
+                "p50_ms": percentile(numbers["ms"], 50),
+                "p95_ms": percentile(numbers["ms"], 95),
+                "p99_ms": percentile(numbers["ms"], 99),
+                "alloc_kb": sum(numbers["alloc_kb"]) / len(numbers["alloc_kb"]),
+            }
+        return summary
+
+    def _report(self, report, baseline=None):
+        columns = ("queries", "p50_ms", "p95_ms", "p99_ms", "alloc_kb")
+        for mode, summary in report["results"].items():
+            self.stdout.write("\n{} cache".format(mode))
+            self.stdout.write(
+                "{:<18}".format("scenario")
+                + "".join("{:>20}".format(column) for column in columns)
+            )
+            for name, numbers in summary.items():
+                line = "{:<18}".format(name)
+                for column in columns:
+                    value = "{:.2f}".format(numbers[column])
+                    if baseline:
+                        before = baseline["results"][mode][name][column]
+                        if before:
+                            value += " ({:+.0f}%)".format(
+                                (numbers[column] - before) / before * 100
+                            )
+                    line += "{:>20}".format(value)
+                self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            # Creates (and rolls back) pages and a site. Keep this away from production.
+            raise RuntimeError("Command can not be run in production.")
+        model = apps.get_model(options["model"])
+        if not issubclass(model, TranslatablePageMixin):
+            raise CommandError("{} is not translatable.".format(options["model"]))
+        baseline = None
+        if options["compare"]:
+            baseline = json.loads(Path(options["compare"]).read_text())
+
+        report = {
+            "model": options["model"],
+            "pages": options["pages"],
+            "depth": options["depth"],
+            "sample": options["sample"],
+            "results": {},
+        }
+        try:
+            with transaction.atomic():
+                page_ids = self._build_tree(model, options["pages"], options["depth"])
+                sample = {
+                    language: ids[: options["sample"]]
+                    for language, ids in page_ids.items()
+                }
+                for mode, warm in (("cold", False), ("warm", True)):
+                    results = self._measure(model, sample, warm)
+                    report["results"][mode] = self._summarize(results)
+                # invalidate everything we cached for the synthetic tree
+                invalidate_translations(
+                    page_ids["de"] + page_ids["en"], on_commit=False
+                )
+                raise Rollback
+        except Rollback:
+            # the language homepages of the synthetic tree are gone again
+            reset_language_homepages()
+
+        self._report(report, baseline)
+        if options["save_baseline"]:
+            Path(options["save_baseline"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write(
+                "\nBaseline saved to {}.".format(options["save_baseline"])
+            )
@@ -0,0 +1,39 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Versions of cached content, e.g. of the page tree snapshot or the menus. They are
+# part of the cache keys (or kept next to process local caches), so bumping the
+# version invalidates all entries at once. Versions are random and never expire:
+# content cached before a version got evicted from the cache is never served again.
+
+
+def get_cache_version(key: str) -> str:
+    """Returns the current version stored at ``key``, adding one if there is none."""
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            # added by a concurrent request
+            version = cache.get(key) or version
+    return version
+
+
+async def aget_cache_version(key: str) -> str:
+    """Async version of ``get_cache_version``."""
+    version = await cache.aget(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key) or version
+    return version
+
+
+def bump_cache_version(key: str):
+    """Replaces the version stored at ``key``, once the transaction commits.
+
+    Until then concurrent requests still see the old rows, a version bumped earlier
+    could get their content cached again.
+    """
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, timeout=None))
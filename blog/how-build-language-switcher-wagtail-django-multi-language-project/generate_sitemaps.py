@@ -0,0 +1,156 @@
+from itertools import islice
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from wagtail.core.models import Page, Site
+
+from codista.cms.models import resolve_translations
+
+SITEMAP_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+    'xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+)
+SITEMAP_FOOTER = "</urlset>\n"
+SITEMAP_INDEX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+SITEMAP_INDEX_FOOTER = "</sitemapindex>\n"
+
+
+class Command(BaseCommand):
+    """Writes the sitemaps of a site, including ``hreflang`` alternates.
+
+    Pages are streamed in path order and the translations of each chunk are resolved
+    with a single query, so memory stays bounded no matter how many pages there are.
+    The output gets split into multiple sitemaps, which are listed in ``sitemap.xml``.
+    """
+
+    help = "Writes the sitemaps (with hreflang alternates) of a site."
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir", help="Directory to write the sitemaps to.")
+        parser.add_argument(
+            "--site", help="Hostname of the site. Defaults to the default site."
+        )
+        parser.add_argument(
+            "--base-url",
+            help="URL the sitemaps are served from. Defaults to the root url of the "
+            "site.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--urls-per-sitemap",
+            type=int,
+            default=50000,
+            help="Sitemaps may not contain more than 50.000 urls.",
+        )
+
+    def _get_site(self, hostname):
+        if hostname:
+            return Site.objects.get(hostname=hostname)
+        return Site.objects.get(is_default_site=True)
+
+    def _iter_chunks(self, site, chunk_size):
+        pages = (
+            Page.objects.live()
+            .public()
+            .descendant_of(site.root_page, inclusive=True)
+            .order_by("path")
+        )
+        iterator = pages.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _render_url(self, page, translated_pages, request):
+        lines = ["<url>", "<loc>{}</loc>".format(escape(page.get_full_url(request)))]
+        if page.last_published_at:
+            lines.append(
+                "<lastmod>{}</lastmod>".format(
+                    page.last_published_at.date().isoformat()
+                )
+            )
+        alternates = {
+            lang_code: translated_page
+            for lang_code, translated_page in translated_pages.items()
+            if translated_page and translated_page.live
+        }
+        # hreflang alternates only make sense for translated pages. They include the
+        # page itself.
+        if len(alternates) > 1:
+            for lang_code, translated_page in sorted(alternates.items()):
+                lines.append(
+                    '<xhtml:link rel="alternate" hreflang={} href={}/>'.format(
+                        quoteattr(lang_code),
+                        quoteattr(translated_page.get_full_url(request)),
+                    )
+                )
+        lines.append("</url>\n")
+        return "".join(lines)
+
+    def _open_sitemap(self, path):
+        sitemap_file = open(path, "w", encoding="utf-8")
+        sitemap_file.write(SITEMAP_HEADER)
+        return sitemap_file
+
+    def _close_sitemap(self, sitemap_file):
+        if sitemap_file:
+            sitemap_file.write(SITEMAP_FOOTER)
+            sitemap_file.close()
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        site = self._get_site(options["site"])
+        output_dir = Path(options["output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        base_url = (options["base_url"] or site.root_url).rstrip("/")
+        urls_per_sitemap = options["urls_per_sitemap"]
+        # wagtail caches the site root paths on the request, so all urls share them.
+        request = RequestFactory().get(
+            "/", SERVER_NAME=site.hostname, SERVER_PORT=site.port
+        )
+
+        sitemap_names = []
+        sitemap_file = None
+        urls_in_sitemap = 0
+        try:
+            for chunk in self._iter_chunks(site, options["chunk_size"]):
+                resolved = resolve_translations(chunk)
+                for page in chunk:
+                    if sitemap_file is None or urls_in_sitemap >= urls_per_sitemap:
+                        self._close_sitemap(sitemap_file)
+                        sitemap_names.append(
+                            "sitemap-{}.xml".format(len(sitemap_names) + 1)
+                        )
+                        sitemap_file = self._open_sitemap(
+                            output_dir.joinpath(sitemap_names[-1])
+                        )
+                        urls_in_sitemap = 0
+                    __, translated_pages = resolved[page.pk]
+                    sitemap_file.write(
+                        self._render_url(page, translated_pages, request)
+                    )
+                    urls_in_sitemap += 1
+        finally:
+            self._close_sitemap(sitemap_file)
+
+        with open(output_dir.joinpath("sitemap.xml"), "w", encoding="utf-8") as f:
+            f.write(SITEMAP_INDEX_HEADER)
+            for name in sitemap_names:
+                f.write(
+                    "<sitemap><loc>{}</loc></sitemap>\n".format(
+                        escape("{}/{}".format(base_url, name))
+                    )
+                )
+            f.write(SITEMAP_INDEX_FOOTER)
+        if verbosity > 0:
+            self.stdout.write(
+                "{} sitemaps written to {}.".format(len(sitemap_names), output_dir)
+            )
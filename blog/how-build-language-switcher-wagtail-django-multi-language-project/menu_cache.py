@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.core.models import Site
+from wagtailmenus.conf import settings as wagtailmenu_settings
+
+from codista.cms.cache_versions import bump_cache_version, get_cache_version
+from codista.cms.page_tree_snapshot import get_page_tree_version
+
+MENU_VERSION_CACHE_KEY = "menu_version"
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_menu_version() -> str:
+    return get_cache_version(MENU_VERSION_CACHE_KEY)
+
+
+def get_menu_cache_key(handle: str, site: Site, section_ids=()) -> str:
+    """The cache key of a rendered menu.
+
+    The handles encode the language already (``main_menu_de``), the active section
+    is given as the ids of the linked pages the current page is in. Changes to the
+    menus or the page tree change the key, old entries just expire.
+    """
+    return "menu:{}:{}:{}:{}:{}".format(
+        handle,
+        site.pk,
+        "-".join(str(section_id) for section_id in sorted(section_ids)),
+        get_menu_version(),
+        get_page_tree_version(),
+    )
+
+
+def bump_menu_version(**kwargs):
+    """Invalidates all cached menus, once the transaction commits."""
+    bump_cache_version(MENU_VERSION_CACHE_KEY)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _bump_menu_version_on_menu_change(sender, **kwargs):
+    # the menu models are swappable, and only known once the apps are loaded
+    if sender in (
+        wagtailmenu_settings.models.FLAT_MENU_MODEL,
+        wagtailmenu_settings.models.FLAT_MENU_ITEM_MODEL,
+        Site,
+    ):
+        bump_menu_version()
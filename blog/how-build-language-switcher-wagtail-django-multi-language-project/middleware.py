@@ -0,0 +1,145 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponseRedirect
+from django.utils.cache import patch_vary_headers
+from django.utils.translation.trans_real import parse_accept_lang_header
+from wagtail.core.models import Page, Site
+from wagtail.core.signals import post_page_move
+
+from codista.cms.models import LANGUAGE_HOMEPAGE_DEPTH
+
+LANGUAGE_REDIRECTS_CACHE_KEY = "language_redirects"
+
+
+def _build_language_redirects() -> dict:
+    """Maps the sites to the urls of their language homepages.
+
+    Returns:
+        dict: It looks like this::
+
+            {
+                "sites": {"www.codista.com:80": {"de": "/de/", "en": "/en/"}},
+                "default": {"de": "/de/", "en": "/en/"},
+            }
+    """
+    language_redirects = {"sites": {}, "default": None}
+    homepages = Page.objects.live().filter(depth=LANGUAGE_HOMEPAGE_DEPTH)
+    for site in Site.objects.select_related("root_page"):
+        urls = {
+            homepage.slug: homepage.get_url(current_site=site)
+            for homepage in homepages.child_of(site.root_page)
+        }
+        urls = {language: url for language, url in urls.items() if url}
+        if not urls:
+            continue
+        language_redirects["sites"]["{}:{}".format(site.hostname, site.port)] = urls
+        if site.is_default_site:
+            language_redirects["default"] = urls
+    return language_redirects
+
+
+def get_language_redirects() -> dict:
+    """Returns the (cached) urls of the language homepages of all sites."""
+    language_redirects = cache.get(LANGUAGE_REDIRECTS_CACHE_KEY)
+    if language_redirects is None:
+        language_redirects = _build_language_redirects()
+        cache.set(LANGUAGE_REDIRECTS_CACHE_KEY, language_redirects, timeout=None)
+    return language_redirects
+
+
+@lru_cache(maxsize=1000)
+def get_preferred_language(
+    accept_language: str, available_languages: Tuple[str, ...]
+) -> Optional[str]:
+    """Picks the best of the available languages for an Accept-Language header.
+
+    Browsers send a small number of different headers, so the results are memoized.
+    """
+    for accepted, __ in parse_accept_lang_header(accept_language):
+        accepted = accepted.lower()
+        if accepted in available_languages:
+            return accepted
+        # "de-AT" is fine for "de"
+        base_language = accepted.split("-")[0]
+        if base_language in available_languages:
+            return base_language
+    return None
+
+
+def get_language_redirect_url(request) -> Optional[str]:
+    """Returns the url of the language homepage to redirect the request to.
+
+    Does not need any queries once the language redirects are cached. Can also be
+    used by ``LanguageRedirectionPage.serve`` when the middleware is not installed.
+    """
+    language_redirects = get_language_redirects()
+    host = request.get_host()
+    if ":" not in host:
+        host = "{}:{}".format(host, request.get_port())
+    urls = language_redirects["sites"].get(host) or language_redirects["default"]
+    if not urls:
+        return None
+
+    language = request.COOKIES.get(settings.LANGUAGE_COOKIE_NAME)
+    if language not in urls:
+        language = get_preferred_language(
+            request.META.get("HTTP_ACCEPT_LANGUAGE", ""), tuple(sorted(urls))
+        )
+    if language not in urls:
+        language = settings.LANGUAGE_CODE if settings.LANGUAGE_CODE in urls else None
+    if language is None:
+        language = sorted(urls)[0]
+    return urls[language]
+
+
+class LanguageRedirectionMiddleware:
+    """Redirects visitors of the root url to their language homepage.
+
+    This answers the most requested url of the site before wagtail looks up the site
+    and serves the ``LanguageRedirectionPage``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path_info == "/" and request.method in ("GET", "HEAD"):
+            url = get_language_redirect_url(request)
+            if url:
+                query_string = request.META.get("QUERY_STRING")
+                if query_string:
+                    url = "{}?{}".format(url, query_string)
+                response = HttpResponseRedirect(url)
+                patch_vary_headers(response, ("Accept-Language", "Cookie"))
+                return response
+        return self.get_response(request)
+
+
+def reset_language_redirects(**kwargs):
+    """Makes the next request build the language redirects anew.
+
+    The entry is removed once the transaction commits. Requests before that still
+    see the old pages and might cache their urls again.
+    """
+    transaction.on_commit(lambda: cache.delete(LANGUAGE_REDIRECTS_CACHE_KEY))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _reset_language_redirects_on_change(sender, instance, **kwargs):
+    """Sites and pages at the top of the tree decide where we redirect to."""
+    if isinstance(instance, Site) or (
+        isinstance(instance, Page) and instance.depth <= LANGUAGE_HOMEPAGE_DEPTH
+    ):
+        reset_language_redirects()
+
+
+@receiver(post_page_move)
+def _reset_language_redirects_on_page_move(sender, instance, **kwargs):
+    reset_language_redirects()
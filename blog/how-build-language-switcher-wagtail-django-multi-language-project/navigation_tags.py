@@ -0,0 +1,104 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from wagtail.core.models import Site
+from wagtailmenus.conf import settings as wagtailmenu_settings
+
+from codista.cms.menu_cache import (
+    MENU_CACHE_TIMEOUT,
+    get_menu_cache_key,
+    get_menu_version,
+)
+from codista.cms.page_tree_snapshot import get_page_tree_snapshot
+
+register = template.Library()
+
+NAVIGATION_MENU_TEMPLATE = "cms/includes/navigation_menu.html"
+
+
+def get_menu_items(handle: str, site: Site) -> list:
+    """The items of a flat menu, as plain values.
+
+    Cached until a menu changes, a single query otherwise.
+    """
+    cache_key = "menu_items:{}:{}:{}".format(handle, site.pk, get_menu_version())
+    items = cache.get(cache_key)
+    if items is None:
+        item_model = wagtailmenu_settings.models.FLAT_MENU_ITEM_MODEL
+        items = list(
+            item_model.objects.filter(menu__handle=handle, menu__site=site)
+            .order_by("sort_order")
+            .values("link_page_id", "link_url", "link_text", "url_append")
+        )
+        cache.set(cache_key, items, MENU_CACHE_TIMEOUT)
+    return items
+
+
+def get_active_sections(items: list, current_page=None) -> set:
+    """The ids of the linked pages ``current_page`` is in."""
+    if current_page is None:
+        return set()
+    snapshot = get_page_tree_snapshot()
+    return {
+        item["link_page_id"]
+        for item in items
+        if item["link_page_id"]
+        and snapshot.is_descendant(current_page.pk, item["link_page_id"])
+    }
+
+
+def resolve_menu_items(items: list, site: Site, active_sections=()) -> list:
+    """Resolves the linked pages of menu items through the page tree snapshot.
+
+    Items linking to pages which are not live (anymore) are left out, like
+    wagtailmenus does.
+    """
+    snapshot = get_page_tree_snapshot()
+    links = []
+    for item in items:
+        link = {"text": item["link_text"], "url": item["link_url"], "is_active": False}
+        if item["link_page_id"]:
+            page = snapshot.get(item["link_page_id"])
+            if page is None or not page.live:
+                continue
+            link["url"] = snapshot.get_url(page.id, site)
+            link["text"] = link["text"] or page.title
+            link["is_active"] = page.id in active_sections
+        if not link["url"]:
+            continue
+        link["url"] += item["url_append"] or ""
+        links.append(link)
+    return links
+
+
+@register.simple_tag(takes_context=True)
+def navigation_menu(context, handle):
+    """Renders a flat menu (e.g. ``main_menu_de``) without querying its pages.
+
+    The HTML is cached per handle, site and active section, until a menu or the page
+    tree changes.
+
+    Usage::
+
+        {% load navigation_tags %}
+        {% navigation_menu "main_menu_de" %}
+    """
+    request = context.get("request")
+    site = Site.find_for_request(request) if request else None
+    if site is None:
+        return ""
+    items = get_menu_items(handle, site)
+    active_sections = get_active_sections(items, context.get("page"))
+    cache_key = get_menu_cache_key(handle, site, active_sections)
+    html = cache.get(cache_key)
+    if html is None:
+        html = render_to_string(
+            NAVIGATION_MENU_TEMPLATE,
+            {
+                "handle": handle,
+                "links": resolve_menu_items(items, site, active_sections),
+            },
+        )
+        cache.set(cache_key, html, MENU_CACHE_TIMEOUT)
+    return mark_safe(html)
@@ -0,0 +1,152 @@
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.core.models import Page, Site
+from wagtail.core.signals import page_published, page_unpublished, post_page_move
+
+from codista.cms.cache_versions import bump_cache_version, get_cache_version
+
+PAGE_TREE_VERSION_CACHE_KEY = "page_tree_snapshot_version"
+# changes to these fields change the snapshot
+PAGE_TREE_SNAPSHOT_FIELDS = {"live", "slug", "url_path", "path", "depth", "title"}
+
+SnapshotPage = namedtuple(
+    "SnapshotPage", "id path depth content_type_id live url_path title"
+)
+
+# the snapshot of this process, see ``get_page_tree_snapshot``
+_snapshot = None
+
+
+class PageTreeSnapshot:
+    """The page tree as a couple of arrays, sorted by page id.
+
+    Holds just what navigation needs to resolve links without any queries. A few
+    bytes per page instead of a model instance, so it can be kept in memory of every
+    process even for large trees.
+    """
+
+    def __init__(self, version: str, rows):
+        rows = sorted(rows)
+        self.version = version
+        self.ids = array("q", (row[0] for row in rows))
+        self.paths = [row[1] for row in rows]
+        self.depths = array("H", (row[2] for row in rows))
+        self.content_type_ids = array("l", (row[3] for row in rows))
+        self.live = array("b", (row[4] for row in rows))
+        self.url_paths = [row[5] for row in rows]
+        self.titles = [row[6] for row in rows]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _index(self, page_id: int) -> Optional[int]:
+        index = bisect_left(self.ids, page_id)
+        if index < len(self.ids) and self.ids[index] == page_id:
+            return index
+        return None
+
+    def get(self, page_id: int) -> Optional[SnapshotPage]:
+        index = self._index(page_id)
+        if index is None:
+            return None
+        return SnapshotPage(
+            self.ids[index],
+            self.paths[index],
+            self.depths[index],
+            self.content_type_ids[index],
+            bool(self.live[index]),
+            self.url_paths[index],
+            self.titles[index],
+        )
+
+    def get_url(self, page_id: int, site: Site = None) -> Optional[str]:
+        """Like ``Page.get_url``: relative for pages of ``site``, absolute otherwise."""
+        index = self._index(page_id)
+        if index is None:
+            return None
+        url_path = self.url_paths[index]
+        # wagtail caches the site root paths
+        for site_root_path in Site.get_site_root_paths():
+            site_id, root_path, root_url = site_root_path[:3]
+            if url_path.startswith(root_path):
+                page_path = url_path[len(root_path) - 1 :]
+                if site is not None and site_id == site.pk:
+                    return page_path
+                return root_url + page_path
+        return None
+
+    def is_descendant(self, page_id: int, ancestor_id: int, inclusive=True) -> bool:
+        """Whether the page is in the section of ``ancestor_id``."""
+        index = self._index(page_id)
+        ancestor_index = self._index(ancestor_id)
+        if index is None or ancestor_index is None:
+            return False
+        if index == ancestor_index:
+            return inclusive
+        return self.paths[index].startswith(self.paths[ancestor_index])
+
+
+def _load_snapshot(version: str) -> PageTreeSnapshot:
+    return PageTreeSnapshot(
+        version,
+        Page.objects.values_list(
+            "id", "path", "depth", "content_type_id", "live", "url_path", "title"
+        ).iterator(),
+    )
+
+
+def get_page_tree_version() -> str:
+    return get_cache_version(PAGE_TREE_VERSION_CACHE_KEY)
+
+
+def get_page_tree_snapshot() -> PageTreeSnapshot:
+    """The snapshot of the page tree, loaded once per process and version.
+
+    Costs a single cache lookup as long as the page tree does not change. Publishing,
+    unpublishing, moving and deleting pages bumps the version, which makes every
+    process load a new snapshot (with a single query) on next access.
+    """
+    global _snapshot
+    version = get_page_tree_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        snapshot = _snapshot = _load_snapshot(version)
+    return snapshot
+
+
+def bump_page_tree_version(**kwargs):
+    """Invalidates the snapshots of all processes, once the transaction commits."""
+    bump_cache_version(PAGE_TREE_VERSION_CACHE_KEY)
+
+
+@receiver(post_save)
+def _bump_page_tree_version_on_page_save(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if not isinstance(instance, Page):
+        return
+    # e.g. saving a draft only updates the revision related fields
+    if (
+        created
+        or update_fields is None
+        or PAGE_TREE_SNAPSHOT_FIELDS.intersection(update_fields)
+    ):
+        bump_page_tree_version()
+
+
+@receiver(post_delete)
+def _bump_page_tree_version_on_page_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        bump_page_tree_version()
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def _bump_page_tree_version_on_page_change(sender, instance, **kwargs):
+    bump_page_tree_version()
@@ -0,0 +1,221 @@
+"""Lets the test databases start out with the data of ``total_reset``.
+
+Put this ``conftest.py`` next to your ``manage.py`` (needs ``pytest-django``).
+
+The migrated and seeded databases are created once per fingerprint of the migrations
+and the seeding commands (see ``snapshot.py``) and kept as template databases. Every
+test session / xdist worker gets its own clone (``CREATE DATABASE ... TEMPLATE``),
+which takes a fraction of a second instead of migrating and seeding again.
+
+The media files of the templates are kept per fingerprint as well, outside of
+``MEDIA_ROOT`` (which ``total_reset`` replaces), and every session / xdist worker
+runs with a hardlinked copy as ``MEDIA_ROOT``. Templates and media of other
+fingerprints are dropped.
+
+Run ``pytest --reset-db-per-module`` to clone the template anew after every test
+module, e.g. for modules using ``transaction=True`` tests which leave data behind.
+"""
+
+import shutil
+import zlib
+
+import psycopg2
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import override_settings
+
+from codista.cms.management.commands.total_reset import DATABASE_CONNECTION_DETAILS
+from codista.cms.management.snapshot import (
+    SEED_SNAPSHOT_DIR,
+    get_fingerprint,
+    link_tree,
+)
+
+# the media files of the template databases, one folder per fingerprint
+TEST_MEDIA_DIR = SEED_SNAPSHOT_DIR.joinpath("test_media")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--reset-db-per-module",
+        action="store_true",
+        help="Clone the test databases from their template after every module.",
+    )
+
+
+def _connect_maintenance_db(database):
+    conn_kwargs = DATABASE_CONNECTION_DETAILS[database].copy()
+    conn_kwargs["dbname"] = "postgres"
+    conn = psycopg2.connect(**conn_kwargs)
+    conn.autocommit = True
+    return conn
+
+
+def _database_exists(cur, dbname):
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", [dbname])
+    return cur.fetchone() is not None
+
+
+def _use_databases(names):
+    """Points the django connections to the given databases."""
+    for database, dbname in names.items():
+        connections[database].close()
+        connections[database].settings_dict["NAME"] = dbname
+        settings.DATABASES[database]["NAME"] = dbname
+
+
+def _clone_databases(template_names, clone_names):
+    for database, dbname in clone_names.items():
+        connections[database].close()
+        conn = _connect_maintenance_db(database)
+        cur = conn.cursor()
+        # DANGER: Not using prepared variables here. hardcore python formatting.
+        cur.execute("DROP DATABASE IF EXISTS {};".format(dbname))
+        cur.execute(
+            "CREATE DATABASE {} TEMPLATE {};".format(dbname, template_names[database])
+        )
+        conn.close()
+
+
+def _drop_databases(names):
+    for database, dbname in names.items():
+        connections[database].close()
+        conn = _connect_maintenance_db(database)
+        # DANGER: Not using prepared variables here. hardcore python formatting.
+        conn.cursor().execute("DROP DATABASE IF EXISTS {};".format(dbname))
+        conn.close()
+
+
+def _drop_stale_templates(template_names, fingerprint):
+    """Drops the templates (and their media) of other fingerprints."""
+    for database, dbname in template_names.items():
+        prefix = dbname[: -len(fingerprint)]
+        conn = _connect_maintenance_db(database)
+        cur = conn.cursor()
+        cur.execute("SELECT datname FROM pg_database;")
+        for (name,) in cur.fetchall():
+            if not name.startswith(prefix) or name.startswith(dbname):
+                continue
+            try:
+                # DANGER: Not using prepared variables here. hardcore python formatting.
+                cur.execute("DROP DATABASE IF EXISTS {};".format(name))
+            except psycopg2.Error:
+                # still used by a session of another checkout
+                pass
+        conn.close()
+    if TEST_MEDIA_DIR.exists():
+        for path in TEST_MEDIA_DIR.iterdir():
+            if not path.name.startswith(fingerprint):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _seed_template_databases(template_names, media_root):
+    """Creates the template databases, unless another worker already did.
+
+    The media files are written to ``media_root``. An advisory lock makes the other
+    workers wait until the seeding is done.
+    """
+    lock_id = zlib.crc32("".join(sorted(template_names.values())).encode())
+    lock_conn = _connect_maintenance_db("default")
+    lock_cur = lock_conn.cursor()
+    lock_cur.execute("SELECT pg_advisory_lock(%s);", [lock_id])
+    try:
+        missing = {}
+        for database, dbname in template_names.items():
+            conn = _connect_maintenance_db(database)
+            if not _database_exists(conn.cursor(), dbname):
+                missing[database] = dbname
+            conn.close()
+        if not missing and media_root.exists():
+            return
+        # a partially seeded set of templates is useless, start from scratch
+        building_names = {
+            database: "{}_building".format(dbname)
+            for database, dbname in template_names.items()
+        }
+        _drop_databases(template_names)
+        _drop_databases(building_names)
+        for database, dbname in building_names.items():
+            conn = _connect_maintenance_db(database)
+            # DANGER: Not using prepared variables here. hardcore python formatting.
+            conn.cursor().execute("CREATE DATABASE {};".format(dbname))
+            conn.close()
+
+        original_names = {
+            database: settings.DATABASES[database]["NAME"]
+            for database in template_names
+        }
+        if media_root.exists():
+            shutil.rmtree(media_root)
+        media_root.mkdir(parents=True)
+        _use_databases(building_names)
+        try:
+            # the seeding commands create the DEV content, like ``total_reset``
+            with override_settings(DEBUG=True, MEDIA_ROOT=str(media_root)):
+                call_command("migrate", verbosity=0)
+                call_command("total_setup", verbosity=0)
+                call_command("setup_page_tree", verbosity=0, link_media=True)
+        finally:
+            _use_databases(original_names)
+        # renaming is atomic, so a template exists only when it is complete
+        for database, dbname in building_names.items():
+            conn = _connect_maintenance_db(database)
+            # DANGER: Not using prepared variables here. hardcore python formatting.
+            conn.cursor().execute(
+                "ALTER DATABASE {} RENAME TO {};".format(
+                    dbname, template_names[database]
+                )
+            )
+            conn.close()
+    finally:
+        lock_cur.execute("SELECT pg_advisory_unlock(%s);", [lock_id])
+        lock_conn.close()
+
+
+@pytest.fixture(scope="session")
+def django_db_setup(request, django_db_blocker):
+    """Replaces the test database setup of ``pytest-django``."""
+    fingerprint = get_fingerprint()["fingerprint"]
+    # ``gw0``, ``gw1``, ... when running with xdist
+    worker_id = getattr(request.config, "workerinput", {}).get("workerid", "main")
+    template_names = {}
+    clone_names = {}
+    for database, conn_kwargs in DATABASE_CONNECTION_DETAILS.items():
+        template_names[database] = "{}_template_{}".format(
+            conn_kwargs["dbname"], fingerprint
+        )
+        clone_names[database] = "test_{}_{}".format(conn_kwargs["dbname"], worker_id)
+
+    template_media_root = TEST_MEDIA_DIR.joinpath(fingerprint)
+    media_root = TEST_MEDIA_DIR.joinpath("{}_{}".format(fingerprint, worker_id))
+
+    with django_db_blocker.unblock():
+        _drop_stale_templates(template_names, fingerprint)
+        _seed_template_databases(template_names, template_media_root)
+        _clone_databases(template_names, clone_names)
+        _use_databases(clone_names)
+    request.config._seeded_databases = (template_names, clone_names)
+    # the tests may add or delete media files, they get their own copy
+    if media_root.exists():
+        shutil.rmtree(media_root)
+    link_tree(template_media_root, media_root)
+    media_settings = override_settings(MEDIA_ROOT=str(media_root))
+    media_settings.enable()
+
+    yield
+
+    media_settings.disable()
+    shutil.rmtree(media_root, ignore_errors=True)
+    with django_db_blocker.unblock():
+        _drop_databases(clone_names)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _reset_db_per_module(request, django_db_blocker):
+    yield
+    seeded_databases = getattr(request.config, "_seeded_databases", None)
+    if request.config.getoption("--reset-db-per-module") and seeded_databases:
+        with django_db_blocker.unblock():
+            _clone_databases(*seeded_databases)
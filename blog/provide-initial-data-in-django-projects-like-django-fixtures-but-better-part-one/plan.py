@@ -0,0 +1,176 @@
+"""Helpers for the ``--plan`` mode of the seeding commands.
+
+Lives next to the management commands, e.g. ``<app>/management/plan.py``. Planning
+runs nothing and writes nothing: the records are counted from the fixture files and
+from the source of the setup steps, the media from the sizes of the fixture images.
+Queries and inserted rows are estimated per created object.
+
+Only calls written out in the setup steps are seen. Calls in helper functions and
+loops over data other than literals and ``settings`` are counted once, so seeds
+built that way are undercounted.
+"""
+
+import ast
+import inspect
+import math
+import textwrap
+from collections import Counter
+
+from django.conf import settings
+
+# Estimated queries of the ORM calls the seeding commands make, without the signal
+# handlers of the project. A page added with ``add_child`` costs a lookup of the
+# last child, the update of the parent and one insert per table of its model.
+ADD_CHILD_QUERIES = 2
+SAVE_QUERIES = 3
+# calls ending with these names run one query
+QUERY_METHODS = {
+    "get",
+    "first",
+    "exists",
+    "count",
+    "delete",
+    "create",
+    "bulk_create",
+    "get_first_root_node",
+}
+
+
+def get_method_nodes(cls) -> dict:
+    """The parsed methods of the class, by name."""
+    tree = ast.parse(textwrap.dedent(inspect.getsource(cls)))
+    return {
+        node.name: node
+        for node in tree.body[0].body
+        if isinstance(node, ast.FunctionDef)
+    }
+
+
+def get_call_name(call) -> str:
+    """Dotted name of the called function, e.g. ``"self._set_image"``.
+
+    Chained calls are joined, e.g. ``"Page.objects.filter.delete"``.
+    """
+    parts = []
+    node = call.func
+    while isinstance(node, (ast.Attribute, ast.Call)):
+        if isinstance(node, ast.Call):
+            node = node.func
+            continue
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        # e.g. ``get_model()()``
+        return ""
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def get_keyword(call, name):
+    """The literal value of a keyword argument, ``None`` if it is not a literal."""
+    for keyword in call.keywords:
+        if keyword.arg == name:
+            try:
+                return ast.literal_eval(keyword.value)
+            except ValueError:
+                return None
+    return None
+
+
+def get_model_names(function_node) -> dict:
+    """Local names bound to ``apps.get_model("app.Model")``, mapped to the label."""
+    names = {}
+    for node in ast.walk(function_node):
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Call)
+            and get_call_name(node.value) == "apps.get_model"
+            and node.value.args
+        ):
+            label = ast.literal_eval(node.value.args[0])
+            names[node.targets[0].id] = label
+    return names
+
+
+def get_static_length(node):
+    """Length of a loop iterable known without running anything, else ``None``."""
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return len(node.elts)
+    if (
+        isinstance(node, ast.Attribute)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == "settings"
+    ):
+        return len(getattr(settings, node.attr, ()))
+    return None
+
+
+def iter_calls(node, times=1):
+    """Yields ``(call, times)`` for every call below ``node``.
+
+    ``times`` multiplies the lengths of the surrounding ``for`` loops, loops over
+    iterables which are not known statically count once. All branches of an ``if``
+    are counted, so the numbers are an upper bound.
+    """
+    if isinstance(node, ast.For):
+        length = get_static_length(node.iter)
+        yield from iter_calls(node.iter, times)
+        for child in node.body:
+            yield from iter_calls(child, times * (1 if length is None else length))
+        for child in node.orelse:
+            yield from iter_calls(child, times)
+        return
+    if isinstance(node, ast.Call):
+        yield node, times
+    for child in ast.iter_child_nodes(node):
+        yield from iter_calls(child, times)
+
+
+def plan_files(paths) -> dict:
+    """Sizes of the files to be placed in the media storage."""
+    sizes = {
+        path.name: path.stat().st_size if path.exists() else None for path in paths
+    }
+    return {
+        "images": len(sizes),
+        "media_bytes": sum(size for size in sizes.values() if size is not None),
+        "missing_fixtures": sorted(
+            name for name, size in sizes.items() if size is None
+        ),
+    }
+
+
+def get_tables(model) -> list:
+    """The tables a row of ``model`` is inserted into, those of its concrete parents."""
+    return [
+        table_model._meta.db_table
+        for table_model in [model] + model._meta.get_parent_list()
+        if not table_model._meta.proxy
+    ]
+
+
+def get_chunks(count, chunk_size) -> int:
+    return math.ceil(count / chunk_size)
+
+
+class Estimate:
+    """Sums up the estimated queries and inserted rows per table."""
+
+    def __init__(self):
+        self.queries = 0
+        self.inserts = Counter()
+
+    def add(self, queries=0, inserts=(), times=1):
+        """Adds ``times`` operations, each inserting a row into the ``inserts``."""
+        self.queries += queries * times
+        for table in inserts:
+            self.inserts[table] += times
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": self.queries,
+            "inserted_rows": sum(self.inserts.values()),
+            "inserts": dict(sorted(self.inserts.items())),
+        }
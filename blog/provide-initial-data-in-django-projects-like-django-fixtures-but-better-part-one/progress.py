@@ -0,0 +1,162 @@
+"""Progress of long running management commands.
+
+Lives next to the management commands, e.g. ``<app>/management/progress.py``. Commands
+report phases and the items done per phase. The reporter writes them as JSON lines
+(for CI and log aggregation) and/or as a single, updating line on a terminal::
+
+    {"event": "progress", "phase": "migrate", "done": 12, "total": 80, ...}
+
+Nested commands (e.g. ``setup_page_tree`` called by ``total_reset``) receive the
+reporter of the calling command as ``progress`` option, so all events end up in the
+same stream.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# progress events are written at most every x seconds, phase start/end always
+PROGRESS_INTERVAL = 0.5
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "{}:{:02}:{:02}".format(hours, minutes, seconds)
+    return "{:02}:{:02}".format(minutes, seconds)
+
+
+class Phase:
+    """Counts the items done of a phase."""
+
+    def __init__(self, reporter, name, total=None):
+        self.reporter = reporter
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.reported_at = 0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if self.total is None or not rate:
+            return None
+        return max(0.0, (self.total - self.done) / rate)
+
+    def advance(self, count=1):
+        self.done += count
+        if time.monotonic() - self.reported_at >= PROGRESS_INTERVAL:
+            self.reported_at = time.monotonic()
+            self.reporter.emit("progress", self)
+
+    def as_dict(self):
+        return {
+            "phase": self.name,
+            "done": self.done,
+            "total": self.total,
+            "elapsed_s": round(self.elapsed, 3),
+            "rate": round(self.rate, 3),
+            "eta_s": None if self.eta is None else round(self.eta, 3),
+        }
+
+
+class ProgressReporter:
+    """Writes progress events as JSON lines and/or as live terminal display.
+
+    Args:
+        json_stream: file-like object for the JSON lines, or ``None``.
+        live_stream: file-like object for the live display. It is only used when it
+            is a terminal.
+    """
+
+    def __init__(self, json_stream=None, live_stream=None, owns_json_stream=False):
+        self.json_stream = json_stream
+        self.live_stream = live_stream if live_stream and live_stream.isatty() else None
+        self.owns_json_stream = owns_json_stream
+        self.phases = []
+        # nested commands enter the reporter of the calling command again
+        self.entered = 0
+
+    def __enter__(self):
+        self.entered += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.entered -= 1
+        if self.owns_json_stream and not self.entered:
+            self.json_stream.close()
+
+    @classmethod
+    def from_options(cls, options):
+        """The reporter of the calling command, or a new one.
+
+        Use it as context manager, it closes the ``--progress-json`` file.
+        """
+        if options.get("progress"):
+            return options["progress"]
+        json_stream = None
+        owns_json_stream = False
+        if options.get("progress_json") == "-":
+            json_stream = sys.stderr
+        elif options.get("progress_json"):
+            json_stream = open(options["progress_json"], "a", encoding="utf-8")
+            owns_json_stream = True
+        live_stream = sys.stderr if options.get("verbosity", 1) > 0 else None
+        return cls(json_stream, live_stream, owns_json_stream)
+
+    @staticmethod
+    def add_arguments(parser):
+        parser.add_argument(
+            "--progress-json",
+            help='Write JSON lines progress events to this file ("-" for stderr).',
+        )
+
+    @contextmanager
+    def phase(self, name, total=None):
+        """Reports the start and the end of a phase and yields the ``Phase``."""
+        phase = Phase(self, name, total)
+        self.phases.append(phase)
+        self.emit("phase_start", phase)
+        try:
+            yield phase
+        finally:
+            self.phases.remove(phase)
+            self.emit("phase_end", phase)
+
+    def emit(self, event, phase):
+        if self.json_stream:
+            self.json_stream.write(
+                json.dumps(dict(phase.as_dict(), event=event, ts=time.time())) + "\n"
+            )
+            self.json_stream.flush()
+        if self.live_stream:
+            self._display(event, phase)
+
+    def _display(self, event, phase):
+        # the phase is shown, prefixed by the phases around it
+        names = [p.name for p in self.phases if p is not phase] + [phase.name]
+        line = "{} {}".format(" > ".join(names), phase.done)
+        if phase.total is not None:
+            line += "/{}".format(phase.total)
+        line += "  {:.1f}/s".format(phase.rate)
+        if event == "phase_end":
+            line += "  done in {}".format(format_duration(phase.elapsed))
+        elif phase.eta is not None:
+            line += "  ETA {}".format(format_duration(phase.eta))
+        # overwrite the current line, keep finished phases on screen
+        self.live_stream.write(
+            "\r\033[K" + line + ("\n" if event == "phase_end" else "")
+        )
+        self.live_stream.flush()
@@ -0,0 +1,78 @@
+"""Runs a seeding command through the ``seed_daemon``.
+
+Lives next to ``manage.py`` and only uses the standard library, so it starts
+instantly. Takes the same arguments as ``manage.py``::
+
+    python seed_client.py total_reset --link-media
+    python seed_client.py --socket /tmp/seed.sock setup_page_tree
+
+Falls back to ``manage.py`` when no daemon is running.
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+SEED_DAEMON_SOCKET = os.environ.get("SEED_DAEMON_SOCKET", ".seed_daemon.sock")
+
+# how long to wait for a restarting daemon
+RESTART_TIMEOUT = 60
+
+
+def connect(path, timeout=0):
+    deadline = time.monotonic() + timeout
+    while True:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(path)
+            return client
+        except OSError:
+            client.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.1)
+
+
+def run(path, argv):
+    """Sends the command to the daemon and returns its exit code.
+
+    Returns ``None`` when there is no daemon.
+    """
+    client = connect(path)
+    while client is not None:
+        with client:
+            client.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+            for line in client.makefile("rb"):
+                message = json.loads(line)
+                if "stream" in message:
+                    stream = sys.stdout if message["stream"] == "stdout" else sys.stderr
+                    stream.write(message["data"])
+                    stream.flush()
+                elif "exit" in message:
+                    return message["exit"]
+                elif message.get("restart"):
+                    break
+            else:
+                sys.stderr.write("The daemon went away.\n")
+                return 1
+        # the daemon restarts, because its sources changed
+        client = connect(path, timeout=RESTART_TIMEOUT)
+    return None
+
+
+def main():
+    argv = sys.argv[1:]
+    path = SEED_DAEMON_SOCKET
+    if argv[:1] == ["--socket"]:
+        path, argv = argv[1], argv[2:]
+    exit_code = run(path, argv)
+    if exit_code is None:
+        sys.stderr.write("No daemon listening on {}, using manage.py.\n".format(path))
+        os.execv(sys.executable, [sys.executable, "manage.py"] + argv)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# should be added to your configuration / settings.py, the client
+# (``seed_client.py``) uses the same default
+SEED_DAEMON_SOCKET = getattr(settings, "SEED_DAEMON_SOCKET", ".seed_daemon.sock")
+
+# the commands the daemon runs on request
+DAEMON_COMMANDS = ("total_reset", "total_setup", "setup_page_tree")
+
+
+class SocketStream:
+    """File-like object sending everything written to it to the client."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, data):
+        if data:
+            # fails when the client went away, which ends the command
+            self.connection.sendall(
+                json.dumps({"stream": self.name, "data": data}).encode() + b"\n"
+            )
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def send_message(connection, message):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def receive_request(connection):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.decode())
+
+
+class Command(BaseCommand):
+    """DEV ONLY: Keeps Django loaded and runs the seeding commands on request.
+
+    Starting a management command costs seconds (``django.setup()``, importing
+    Wagtail, ...) before any work is done. The daemon pays this once: it loads the
+    commands and then waits for requests on a Unix socket. Every request is run in a
+    forked child process, so nothing a run leaves behind (database connections,
+    module level caches, ...) leaks into the next one. Requests are run one at a time.
+
+    When a loaded source file of the project changes, the daemon restarts itself
+    before running the next request. Send requests with ``seed_client.py``::
+
+        python manage.py seed_daemon &
+        python seed_client.py total_reset --link-media
+    """
+
+    help = "DEV ONLY: Keeps Django loaded and runs the seeding commands on request."
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=SEED_DAEMON_SOCKET,
+            help="Path of the Unix socket. Defaults to {}.".format(SEED_DAEMON_SOCKET),
+        )
+
+    def _load_commands(self):
+        """Imports the commands, so every child starts with them loaded."""
+        commands = get_commands()
+        return {
+            name: load_command_class(commands[name], name)
+            for name in DAEMON_COMMANDS
+            if name in commands
+        }
+
+    def _get_source_mtimes(self):
+        """Modification times of the loaded source files of the project."""
+        project_dir = str(Path.cwd())
+        mtimes = {}
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if not path or not path.startswith(project_dir) or "site-packages" in path:
+                continue
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _bind(self, path):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                # left behind by a daemon which did not shut down properly
+                os.remove(path)
+            else:
+                raise CommandError("A daemon is already listening on {}.".format(path))
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        # the daemon runs anything it is asked to, keep it to the current user
+        os.chmod(path, 0o600)
+        server.listen()
+        return server
+
+    def _run_request(self, connection, argv):
+        """Runs the command in a child process and returns its exit code."""
+        # connections must not be shared with the child
+        connections.close_all()
+        pid = os.fork()
+        if pid:
+            __, status = os.waitpid(pid, 0)
+            return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+        # the child
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        stdout = SocketStream(connection, "stdout")
+        stderr = SocketStream(connection, "stderr")
+        exit_code = 0
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    if not argv or argv[0] not in DAEMON_COMMANDS:
+                        raise CommandError(
+                            "Unknown command {!r}, choose from: {}.".format(
+                                argv[0] if argv else "", ", ".join(DAEMON_COMMANDS)
+                            )
+                        )
+                    call_command(*argv, stdout=stdout, stderr=stderr)
+                except CommandError as e:
+                    stderr.write("CommandError: {}\n".format(e))
+                    exit_code = 1
+                except SystemExit as e:
+                    # like the interpreter: None is success, other objects are
+                    # printed to stderr and exit with 1
+                    if e.code is None:
+                        exit_code = 0
+                    elif isinstance(e.code, int):
+                        exit_code = e.code
+                    else:
+                        stderr.write("{}\n".format(e.code))
+                        exit_code = 1
+                except Exception:
+                    stderr.write(traceback.format_exc())
+                    exit_code = 1
+                connections.close_all()
+        finally:
+            # never return into the serving loop of the parent
+            os._exit(exit_code)
+
+    def _serve(self, server):
+        mtimes = self._get_source_mtimes()
+        while True:
+            connection, __ = server.accept()
+            with connection:
+                try:
+                    request = receive_request(connection)
+                except (OSError, ValueError):
+                    continue
+                if self._get_source_mtimes() != mtimes:
+                    # the client sends the request again
+                    send_message(connection, {"restart": True})
+                    return True
+                argv = [str(arg) for arg in request.get("argv", [])]
+                if self.verbosity > 0:
+                    self.stdout.write("Running: {}".format(" ".join(argv)))
+                exit_code = self._run_request(connection, argv)
+                try:
+                    send_message(connection, {"exit": exit_code})
+                except OSError:
+                    pass
+                if self.verbosity > 0:
+                    self.stdout.write("Done with exit code {}.".format(exit_code))
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            # Runs the reset commands on request. Keep this away from production.
+            raise RuntimeError("Command can not be run in production.")
+        self.verbosity = options["verbosity"]
+        path = options["socket"]
+        self._load_commands()
+        server = self._bind(path)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        if self.verbosity > 0:
+            self.stdout.write("Listening on {}.".format(path))
+        try:
+            restart = self._serve(server)
+        except KeyboardInterrupt:
+            restart = False
+        finally:
+            server.close()
+            os.remove(path)
+        if restart:
+            if self.verbosity > 0:
+                self.stdout.write("Sources changed, restarting.")
+            self.stdout.flush()
+            os.execv(sys.executable, [sys.executable] + sys.argv)
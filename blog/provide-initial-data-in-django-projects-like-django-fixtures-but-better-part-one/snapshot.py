@@ -0,0 +1,188 @@
+"""Snapshots of a freshly seeded database and its media files.
+
+Lives next to the management commands, e.g. ``<app>/management/snapshot.py``. A
+snapshot is a directory containing a ``pg_dump`` of each database (directory format,
+so it can be restored in parallel), a hardlinked copy of ``MEDIA_ROOT`` and a
+manifest. Snapshots are stored per fingerprint of the migrations and the seeding
+fixtures, so a snapshot is only ever restored when nothing relevant has changed.
+"""
+
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import get_commands
+from django.db.migrations.loader import MigrationLoader
+
+# should be added to your configuration / settings.py
+SEED_SNAPSHOT_DIR = Path(getattr(settings, "SEED_SNAPSHOT_DIR", ".seed_snapshots"))
+
+# The commands which create the initial data. Their source, their ``FIXTURES_DIR``
+# and the helper modules next to them (``<app>/management/*.py``, e.g.
+# ``page_tree.py``) are part of the fingerprint.
+SEED_COMMANDS = ("total_setup", "create_project_users", "setup_page_tree")
+
+# should be added to your configuration / settings.py: further modules the seeding
+# depends on, e.g. ``("codista.cms.models",)``. Also part of the fingerprint.
+SEED_MODULES = getattr(settings, "SEED_MODULES", ())
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _hash_files(files: dict) -> str:
+    """Hash of the given files, keyed by names relative to their package.
+
+    Absolute paths would differ between checkouts and virtualenvs (e.g. in CI), so
+    snapshots would never be reused there.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode())
+        digest.update(Path(files[name]).read_bytes())
+    return digest.hexdigest()
+
+
+def get_migrations_hash() -> str:
+    """Hash of all migration files of all installed apps."""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    files = {}
+    for migration in loader.disk_migrations.values():
+        module = importlib.import_module(migration.__module__)
+        files[migration.__module__] = module.__file__
+    return _hash_files(files)
+
+
+def get_fixtures_hash() -> str:
+    """Hash of the seeding commands, their helper modules and their fixture files."""
+    commands = get_commands()
+    files = {}
+    for module_name in SEED_MODULES:
+        files[module_name] = importlib.import_module(module_name).__file__
+    for name in SEED_COMMANDS:
+        package_name = "{}.management".format(commands[name])
+        package = importlib.import_module(package_name)
+        for path in Path(package.__file__).parent.glob("*.py"):
+            files["{}.{}".format(package_name, path.stem)] = path
+        module_name = "{}.commands.{}".format(package_name, name)
+        module = importlib.import_module(module_name)
+        files[module_name] = module.__file__
+        fixtures_dir = getattr(module, "FIXTURES_DIR", None)
+        if fixtures_dir and Path(fixtures_dir).exists():
+            for path in Path(fixtures_dir).rglob("*"):
+                if path.is_file():
+                    relative_path = path.relative_to(fixtures_dir).as_posix()
+                    files["{}:{}".format(module_name, relative_path)] = path
+    return _hash_files(files)
+
+
+def get_fingerprint() -> dict:
+    migrations_hash = get_migrations_hash()
+    fixtures_hash = get_fixtures_hash()
+    combined = hashlib.sha256(
+        "{}:{}".format(migrations_hash, fixtures_hash).encode()
+    ).hexdigest()
+    return {
+        "fingerprint": combined[:16],
+        "migrations_hash": migrations_hash,
+        "fixtures_hash": fixtures_hash,
+    }
+
+
+def get_snapshot_path(fingerprint: dict) -> Path:
+    return SEED_SNAPSHOT_DIR.joinpath(fingerprint["fingerprint"])
+
+
+def find_snapshot(fingerprint: dict):
+    """Returns the path of the snapshot for this fingerprint, if there is one."""
+    path = get_snapshot_path(fingerprint)
+    manifest_path = path.joinpath(MANIFEST_NAME)
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    if (
+        manifest["migrations_hash"] != fingerprint["migrations_hash"]
+        or manifest["fixtures_hash"] != fingerprint["fixtures_hash"]
+    ):
+        return None
+    return path
+
+
+def _pg_args(conn_kwargs: dict) -> list:
+    args = []
+    for key, flag in (("host", "--host"), ("port", "--port"), ("user", "--username")):
+        if conn_kwargs.get(key):
+            args += [flag, str(conn_kwargs[key])]
+    return args
+
+
+def _pg_env(conn_kwargs: dict) -> dict:
+    env = os.environ.copy()
+    if conn_kwargs.get("password"):
+        env["PGPASSWORD"] = conn_kwargs["password"]
+    return env
+
+
+def link_tree(source: Path, target: Path):
+    """Copies a directory tree using hardlinks. Falls back to copying."""
+    for directory, __, filenames in os.walk(source):
+        target_directory = target.joinpath(Path(directory).relative_to(source))
+        target_directory.mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            source_file = Path(directory, filename)
+            target_file = target_directory.joinpath(filename)
+            try:
+                os.link(source_file, target_file)
+            except OSError:
+                # e.g. different filesystems
+                shutil.copy2(source_file, target_file)
+
+
+def save_snapshot(fingerprint: dict, database_connection_details: dict, jobs: int):
+    """Dumps all databases and links the media files into a new snapshot."""
+    path = get_snapshot_path(fingerprint)
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+    for database, conn_kwargs in database_connection_details.items():
+        subprocess.run(
+            ["pg_dump", "--format=directory", "--jobs={}".format(jobs)]
+            + _pg_args(conn_kwargs)
+            + ["--file", str(path.joinpath("db", database)), conn_kwargs["dbname"]],
+            env=_pg_env(conn_kwargs),
+            check=True,
+        )
+    media_root = Path(settings.MEDIA_ROOT)
+    if media_root.exists():
+        link_tree(media_root, path.joinpath("media"))
+    manifest = dict(
+        fingerprint,
+        databases=list(database_connection_details),
+        created_at=datetime.datetime.now().isoformat(),
+    )
+    # the manifest is written last, half written snapshots are never used.
+    path.joinpath(MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    return path
+
+
+def restore_snapshot(path: Path, database_connection_details: dict, jobs: int):
+    """Restores a snapshot into the (empty) databases and ``MEDIA_ROOT``."""
+    for database, conn_kwargs in database_connection_details.items():
+        subprocess.run(
+            ["pg_restore", "--jobs={}".format(jobs), "--no-owner"]
+            + _pg_args(conn_kwargs)
+            + ["--dbname", conn_kwargs["dbname"], str(path.joinpath("db", database))],
+            env=_pg_env(conn_kwargs),
+            check=True,
+        )
+    media_root = Path(settings.MEDIA_ROOT)
+    if media_root.exists():
+        shutil.rmtree(media_root)
+    media_root.mkdir(parents=True)
+    if path.joinpath("media").exists():
+        link_tree(path.joinpath("media"), media_root)
@@ -1,8 +1,37 @@
+import json
+import os
+from io import StringIO
+from pathlib import Path
+
 import psycopg2
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.management import call_command
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations.loader import MigrationLoader
+
+from ..plan import Estimate
+from ..progress import ProgressReporter
+from ..snapshot import find_snapshot, get_fingerprint, restore_snapshot, save_snapshot
+from .create_project_users import USERS
 
+# should be added to your configuration / settings.py: the cache keys whose entries
+# belong to the old database. Versions of cached content get deleted, which bumps
+# them, so the shared cache does not have to be cleared. The defaults are the
+# version keys of the language switcher post (page tree, menu, language homepages,
+# translations and switchers) and its cached language redirects.
+SEED_RESET_CACHE_KEYS = getattr(
+    settings,
+    "SEED_RESET_CACHE_KEYS",
+    (
+        "page_tree_snapshot_version",
+        "menu_version",
+        "language_homepages_version",
+        "translations_version",
+        "language_redirects",
+    ),
+)
 
 DATABASE_CONNECTION_DETAILS = {}
 for database, conn_details in settings.DATABASES.items():
@@ -19,6 +48,42 @@ class Command(BaseCommand):
     help = "DEV ONLY: Dumps the entire DB and sets up everything anew."
     requires_system_checks = False
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Save the seeded databases and media files as snapshot.",
+        )
+        parser.add_argument(
+            "--from-snapshot",
+            action="store_true",
+            help="Restore the snapshot matching the current migrations and fixtures "
+            "instead of seeding. Seeds (and saves a snapshot) if there is none.",
+        )
+        parser.add_argument(
+            "--require-snapshot",
+            action="store_true",
+            help="Fail instead of seeding when there is no matching snapshot.",
+        )
+        parser.add_argument(
+            "--link-media",
+            action="store_true",
+            help="Link the fixture images into MEDIA_ROOT instead of copying them.",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=os.cpu_count(),
+            help="Parallel jobs of pg_dump / pg_restore.",
+        )
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="Print what would be done, with estimated queries and inserts, as JSON "
+            "without writing anything. See setup_page_tree --plan for its limits.",
+        )
+        ProgressReporter.add_arguments(parser)
+
     def _terminate_db_connections(self, database):
         """Terminates the database connections to be able to drop the database"""
         conn_kwargs = DATABASE_CONNECTION_DETAILS[database]
@@ -68,21 +133,102 @@ class Command(BaseCommand):
                 raise e
             self._create_db(database)
 
-    def handle(self, *args, **options):
-        """entry point"""
+    def _get_db_size(self, database):
+        """Size of the database in bytes, ``None`` if it does not exist."""
+        conn_kwargs = DATABASE_CONNECTION_DETAILS[database]
+        postgres_db_conn_kwargs = conn_kwargs.copy()
+        postgres_db_conn_kwargs["dbname"] = "postgres"
+        conn = psycopg2.connect(**postgres_db_conn_kwargs)
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT pg_database_size(datname) FROM pg_database WHERE datname = %s;",
+            [conn_kwargs["dbname"]],
+        )
+        row = cur.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def _plan(self, options):
+        """Returns what ``total_reset`` would do with these options."""
+        plan = {
+            "drop_databases": {
+                conn_kwargs["dbname"]: self._get_db_size(database)
+                for database, conn_kwargs in DATABASE_CONNECTION_DETAILS.items()
+            }
+        }
+        if options["from_snapshot"] or options["require_snapshot"]:
+            fingerprint = get_fingerprint()
+            snapshot_path = find_snapshot(fingerprint)
+            plan["snapshot"] = {
+                "fingerprint": fingerprint["fingerprint"],
+                "path": str(snapshot_path) if snapshot_path else None,
+            }
+            if snapshot_path:
+                plan["snapshot"]["bytes"] = sum(
+                    path.stat().st_size
+                    for path in Path(snapshot_path).rglob("*")
+                    if path.is_file()
+                )
+                return plan
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        plan["migrations"] = len(loader.disk_migrations)
+        # the databases are fresh, the admin and every project user are looked up and
+        # created. The django and wagtail sites are looked up and saved.
+        estimate = Estimate()
+        estimate.add(2, [get_user_model()._meta.db_table], len(USERS) + 1)
+        estimate.add(4)
+        plan["total_setup"] = {"users": len(USERS) + 1, **estimate.as_dict()}
+        out = StringIO()
+        call_command(
+            "setup_page_tree",
+            verbosity=0,
+            link_media=options["link_media"],
+            plan=True,
+            stdout=out,
+        )
+        plan["setup_page_tree"] = json.loads(out.getvalue())
+        return plan
+
+    def _reset(self, options, progress):
         verbosity = options["verbosity"]
-        if not settings.DEBUG:
-            # YOU SHOULD NEVER TRUST THIS COMMAND FOR PRODUCTION USAGE.
-            raise RuntimeError("Command can not be run in production.")
+        fingerprint = None
+        snapshot_path = None
+        if (
+            options["snapshot"]
+            or options["from_snapshot"]
+            or options["require_snapshot"]
+        ):
+            fingerprint = get_fingerprint()
+        if options["from_snapshot"] or options["require_snapshot"]:
+            snapshot_path = find_snapshot(fingerprint)
+            if snapshot_path is None and options["require_snapshot"]:
+                raise CommandError(
+                    "No snapshot for fingerprint {}.".format(fingerprint["fingerprint"])
+                )
+
+        with progress.phase(
+            "recreate_databases", total=len(settings.DATABASES)
+        ) as phase:
+            for database in settings.DATABASES.keys():
+                self._terminate_db_connections(database)
+                self._create_or_recreate_db(database)
+                phase.advance()
 
-        for database in settings.DATABASES.keys():
-            self._terminate_db_connections(database)
-            self._create_or_recreate_db(database)
+        if snapshot_path:
+            with progress.phase("restore_snapshot"):
+                restore_snapshot(
+                    snapshot_path, DATABASE_CONNECTION_DETAILS, options["jobs"]
+                )
+            if verbosity > 0:
+                self.stdout.write("Snapshot {} restored.".format(snapshot_path))
+            return
 
-        call_command("migrate", verbosity=verbosity)
+        with progress.phase("migrate"):
+            call_command("migrate", verbosity=verbosity)
         if verbosity > 0:
             self.stdout.write("Migrations done.")
-        call_command("total_setup", verbosity=verbosity)
+        with progress.phase("total_setup"):
+            call_command("total_setup", verbosity=verbosity)
 
         # Total setup only creates content when there was a dump created by our
         # ``total_dump`` command.
@@ -91,4 +237,33 @@ class Command(BaseCommand):
             self.stdout.write(msg)
         # this is a wagtail specific management command to setup some initial Wagtail pages
         # only needed if you are using Wagtail
-        call_command("setup_page_tree", verbosity=verbosity)
+        call_command(
+            "setup_page_tree",
+            verbosity=verbosity,
+            link_media=options["link_media"],
+            progress=progress,
+        )
+
+        if fingerprint:
+            with progress.phase("save_snapshot"):
+                snapshot_path = save_snapshot(
+                    fingerprint, DATABASE_CONNECTION_DETAILS, options["jobs"]
+                )
+            if verbosity > 0:
+                self.stdout.write("Snapshot saved to {}.".format(snapshot_path))
+
+    def handle(self, *args, **options):
+        """entry point"""
+        if not settings.DEBUG:
+            # YOU SHOULD NEVER TRUST THIS COMMAND FOR PRODUCTION USAGE.
+            raise RuntimeError("Command can not be run in production.")
+
+        if options["plan"]:
+            self.stdout.write(json.dumps(self._plan(options), indent=2))
+            return
+
+        with ProgressReporter.from_options(options) as progress:
+            with progress.phase("total_reset"):
+                self._reset(options, progress)
+        # cached content, like rendered menus, belongs to the old database
+        cache.delete_many(SEED_RESET_CACHE_KEYS)
@@ -11,7 +11,7 @@ from django.core.management.base import BaseCommand
 PROJECT_USES_CMS = False
 
 try:
-    from wagtail.core.models import Page, PageRevision
+    from wagtail.core.models import Page
     from wagtail.core.models import Site as WagtailSite
 
     PROJECT_USES_CMS = True
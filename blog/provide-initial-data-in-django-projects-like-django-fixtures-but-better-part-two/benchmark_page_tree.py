@@ -0,0 +1,242 @@
+import json
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from wagtail.core.models import Page, Site
+
+from ..benchmark import percentile
+
+
+class Command(BaseCommand):
+    """DEV ONLY: Benchmarks rendering every live page of a site.
+
+    The pages are requested through django's test client, which calls the WSGI
+    handler in-process: no web server or other external services are involved. The
+    requests are spread across worker threads, each with its own database connection.
+    Latency, queries and response size are reported per page type and can be saved as
+    JSON and compared to an earlier report.
+    """
+
+    help = "DEV ONLY: Benchmarks rendering every live page of a site."
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site", help="Hostname of the site. Defaults to the default site."
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--rounds", type=int, default=1, help="How often every page is requested."
+        )
+        parser.add_argument(
+            "--no-warmup",
+            action="store_true",
+            help="Do not request every page once before measuring.",
+        )
+        parser.add_argument("--limit", type=int, help="Only benchmark this many pages.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--compare", help="Compare the results to this report.")
+
+    def _get_site(self, hostname):
+        if hostname:
+            return Site.objects.get(hostname=hostname)
+        return Site.objects.get(is_default_site=True)
+
+    def _get_urls(self, site, limit):
+        """Returns ``(page type, url)`` of all live pages of the site."""
+        pages = (
+            Page.objects.live()
+            .descendant_of(site.root_page, inclusive=True)
+            .select_related("content_type")
+            .order_by("path")
+        )
+        if limit:
+            pages = pages[:limit]
+        urls = []
+        for page in pages.iterator():
+            url = page.relative_url(site)
+            if url:
+                urls.append((page.content_type.model_class().__name__, url))
+        return urls
+
+    def _request(self, client, site, url):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                response = client.get(
+                    url, SERVER_NAME=site.hostname, SERVER_PORT=str(site.port)
+                )
+            except Exception as e:
+                # the test client re-raises exceptions of the views
+                return {
+                    "url": url,
+                    "error": "{}: {}".format(type(e).__name__, e),
+                    "traceback": traceback.format_exc(),
+                }
+            if response.streaming:
+                size = len(b"".join(response.streaming_content))
+            else:
+                size = len(response.content)
+        return {
+            "url": url,
+            "ms": (time.perf_counter() - start) * 1000,
+            "queries": len(queries),
+            "bytes": size,
+            "status": response.status_code,
+        }
+
+    def _run(self, site, urls, workers, measure):
+        """Requests all urls from ``workers`` threads and collects the numbers."""
+        tasks = queue.Queue()
+        for task in urls:
+            tasks.put(task)
+        results = defaultdict(list)
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    try:
+                        page_type, url = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    result = self._request(client, site, url)
+                    if measure:
+                        with lock:
+                            results[page_type].append(result)
+            finally:
+                # every thread has its own database connection
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for __ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _summarize(self, results):
+        summary = {}
+        for page_type, page_results in sorted(results.items()):
+            ok = []
+            failures = []
+            for result in page_results:
+                if "error" not in result and result["status"] < 400:
+                    ok.append(result)
+                else:
+                    failures.append(result)
+            numbers = {
+                "requests": len(page_results),
+                "errors": len(failures),
+            }
+            if ok:
+                latencies = [result["ms"] for result in ok]
+                numbers.update(
+                    {
+                        "p50_ms": percentile(latencies, 50),
+                        "p95_ms": percentile(latencies, 95),
+                        "p99_ms": percentile(latencies, 99),
+                        "queries": sum(result["queries"] for result in ok) / len(ok),
+                        "bytes": sum(result["bytes"] for result in ok) / len(ok),
+                    }
+                )
+            if failures:
+                # every failing url once, with the exception or the status it got
+                numbers["failures"] = list(
+                    {
+                        result["url"]: {
+                            key: result[key]
+                            for key in ("url", "status", "error", "traceback")
+                            if key in result
+                        }
+                        for result in failures
+                    }.values()
+                )
+            summary[page_type] = numbers
+        return summary
+
+    def _report(self, report, baseline=None):
+        columns = (
+            "requests",
+            "errors",
+            "p50_ms",
+            "p95_ms",
+            "p99_ms",
+            "queries",
+            "bytes",
+        )
+        self.stdout.write(
+            "{:<24}".format("page type")
+            + "".join("{:>18}".format(column) for column in columns)
+        )
+        for page_type, numbers in report["results"].items():
+            line = "{:<24}".format(page_type)
+            for column in columns:
+                if column not in numbers:
+                    line += "{:>18}".format("-")
+                    continue
+                value = "{:.2f}".format(numbers[column])
+                if baseline and column not in ("requests", "errors"):
+                    before = baseline["results"].get(page_type, {}).get(column)
+                    if before:
+                        value += " ({:+.0f}%)".format(
+                            (numbers[column] - before) / before * 100
+                        )
+                line += "{:>18}".format(value)
+            self.stdout.write(line)
+        for page_type, numbers in report["results"].items():
+            for failure in numbers.get("failures", []):
+                self.stderr.write(
+                    "\n{} {}: {}".format(
+                        page_type,
+                        failure["url"],
+                        failure.get("error") or "HTTP {}".format(failure["status"]),
+                    )
+                )
+                if self.verbosity > 1 and "traceback" in failure:
+                    self.stderr.write(failure["traceback"])
+        self.stdout.write("\nTotal: {:.2f}s".format(report["total_s"]))
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            # Hammers the site with requests. Keep this away from production.
+            raise RuntimeError("Command can not be run in production.")
+        self.verbosity = options["verbosity"]
+        site = self._get_site(options["site"])
+        urls = self._get_urls(site, options["limit"])
+        baseline = None
+        if options["compare"]:
+            baseline = json.loads(Path(options["compare"]).read_text())
+
+        # the test client sends the hostname of the site
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ["*"]):
+            if not options["no_warmup"]:
+                self._run(site, urls, options["workers"], measure=False)
+            start = time.perf_counter()
+            results = self._run(
+                site, urls * options["rounds"], options["workers"], measure=True
+            )
+            total_s = time.perf_counter() - start
+
+        report = {
+            "site": site.hostname,
+            "pages": len(urls),
+            "workers": options["workers"],
+            "rounds": options["rounds"],
+            "total_s": total_s,
+            "results": self._summarize(results),
+        }
+        self._report(report, baseline)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write("Report saved to {}.".format(options["output"]))
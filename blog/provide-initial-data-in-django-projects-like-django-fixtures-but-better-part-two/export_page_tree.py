@@ -0,0 +1,121 @@
+import json
+import sys
+from itertools import islice
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from wagtail.core.models import Page, Site
+from wagtail.images.models import Image
+
+from codista.cms.models import get_specific_pages
+
+from ..page_tree import (
+    FIXTURE_VERSION,
+    get_exported_fields,
+    is_image_link,
+    serialize_image,
+    serialize_page,
+)
+from ..progress import ProgressReporter
+
+
+class Command(BaseCommand):
+    """Exports the page tree as fixture, which ``setup_page_tree --fixture`` loads.
+
+    The pages are streamed in path order in chunks. The specific instances of a chunk
+    are loaded with one query per content type and every page is written right away,
+    so exports of huge trees need constant memory. See ``page_tree.py`` for the format.
+    """
+
+    help = "Exports the page tree as fixture for setup_page_tree --fixture."
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", help='File to write the fixture to ("-" for stdout).'
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        ProgressReporter.add_arguments(parser)
+
+    def _iter_chunks(self, queryset, chunk_size):
+        iterator = queryset.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _write(self, output, data):
+        output.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    def _get_image_ids(self, pages):
+        """Ids of the images the pages link to, one query per page model and link."""
+        ContentType = apps.get_model("contenttypes.ContentType")
+        content_type_ids = pages.order_by().values_list("content_type", flat=True)
+        image_ids = set()
+        for content_type_id in content_type_ids.distinct():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            # also fails early, when the model has links which can not be exported
+            for field in get_exported_fields(model):
+                if is_image_link(field):
+                    image_ids.update(
+                        model._base_manager.exclude(
+                            **{field.attname: None}
+                        ).values_list(field.attname, flat=True)
+                    )
+        return image_ids
+
+    def _export(self, output, chunk_size, progress):
+        PageTranslation = apps.get_model("cms.PageTranslation")
+        self._write(output, {"type": "header", "version": FIXTURE_VERSION})
+        # the root node is created by the wagtail migrations
+        pages = Page.objects.filter(depth__gt=1).order_by("path")
+        with progress.phase("images"):
+            images = Image.objects.filter(pk__in=self._get_image_ids(pages))
+            for image in images.order_by("pk"):
+                self._write(output, serialize_image(image))
+        with progress.phase("pages", total=pages.count()) as phase:
+            for chunk in self._iter_chunks(pages, chunk_size):
+                for page in get_specific_pages(chunk):
+                    self._write(output, serialize_page(page))
+                phase.advance(len(chunk))
+        with progress.phase("translations"):
+            translations = PageTranslation.objects.order_by("page_id").values_list(
+                "page_id", "group", "language"
+            )
+            for page_id, group, language in translations.iterator(
+                chunk_size=chunk_size
+            ):
+                self._write(
+                    output,
+                    {
+                        "type": "translation",
+                        "page": page_id,
+                        "group": str(group),
+                        "language": language,
+                    },
+                )
+        for site in Site.objects.order_by("pk"):
+            self._write(
+                output,
+                {
+                    "type": "site",
+                    "root_page": site.root_page_id,
+                    "fields": {
+                        "hostname": site.hostname,
+                        "port": site.port,
+                        "site_name": site.site_name,
+                        "is_default_site": site.is_default_site,
+                    },
+                },
+            )
+
+    def handle(self, *args, **options):
+        with ProgressReporter.from_options(options) as progress:
+            if options["output"] == "-":
+                self._export(sys.stdout, options["chunk_size"], progress)
+                return
+            with open(options["output"], "w", encoding="utf-8") as output:
+                self._export(output, options["chunk_size"], progress)
+        if options["verbosity"] > 0:
+            self.stdout.write("Page tree exported to {}.".format(options["output"]))
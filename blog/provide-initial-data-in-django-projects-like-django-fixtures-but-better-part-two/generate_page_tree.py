@@ -0,0 +1,307 @@
+import json
+import random
+import uuid
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+from wagtail.core.models import Page
+from wagtail.images.models import Image
+
+from ..page_tree import bulk_insert_pages, create_missing_revisions
+from ..progress import ProgressReporter
+from .setup_page_tree import FIXTURES_DIR, create_linked_image
+
+WORDS = (
+    "agile api architecture backend cloud consulting data design development "
+    "digital django experience frontend growth innovation integration interface "
+    "operations partnership performance platform product project python quality "
+    "react release reliability research scale security service software solution "
+    "strategy team technology testing usability user vienna wagtail web workflow"
+).split()
+ROLES = ("Developer", "Designer", "Project Manager", "Tech Lead", "Consultant")
+FIRST_NAMES = ("Anna", "Ben", "Clara", "David", "Eva", "Felix", "Hanna", "Jonas")
+LAST_NAMES = ("Bauer", "Fischer", "Gruber", "Huber", "Maier", "Moser", "Wagner")
+
+
+@lru_cache(maxsize=None)
+def has_field(model, name):
+    return any(field.name == name for field in model._meta.get_fields())
+
+
+class Command(BaseCommand):
+    """DEV ONLY: Generates a large, deterministic page tree.
+
+    Creates a new site with a language homepage for each language. Every homepage
+    gets a project and a team member index with the given number of project and team
+    member pages, all linked for translation. The same ``--seed`` always creates the
+    same tree, so profiles of different runs are comparable.
+
+    Project and team member pages are inserted in batches (see ``bulk_insert_pages``),
+    which keeps a million pages practical. Run ``update_index`` afterwards if the
+    search index is needed.
+    """
+
+    help = "DEV ONLY: Generates a large, deterministic page tree."
+    requires_system_checks = False
+    stealth_options = ("progress",)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--languages",
+            help="Comma separated language codes. Defaults to settings.LANGUAGES.",
+        )
+        parser.add_argument(
+            "--projects", type=int, default=100, help="Project pages per language."
+        )
+        parser.add_argument(
+            "--team-members",
+            type=int,
+            default=100,
+            help="Team member pages per language.",
+        )
+        parser.add_argument(
+            "--images", type=int, default=20, help="Number of images to create."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--hostname", default="generated.localhost")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        ProgressReporter.add_arguments(parser)
+
+    def _words(self, count):
+        return " ".join(self.rng.choice(WORDS) for __ in range(count))
+
+    def _sentence(self):
+        return "{}.".format(self._words(self.rng.randint(8, 16)).capitalize())
+
+    def _paragraph(self):
+        return " ".join(self._sentence() for __ in range(self.rng.randint(3, 6)))
+
+    def _body(self):
+        """StreamField data, like the body of the hand written pages."""
+        blocks = []
+        for __ in range(self.rng.randint(3, 8)):
+            blocks.append(
+                {
+                    "type": "paragraph",
+                    "value": "<h2>{}</h2><p>{}</p>".format(
+                        self._words(3).title(), self._paragraph()
+                    ),
+                }
+            )
+        return json.dumps(blocks)
+
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _create_images(self, count):
+        img_paths = sorted(FIXTURES_DIR.joinpath("img").glob("*.jpg"))
+        if not img_paths:
+            return []
+        images = []
+        for number in range(count):
+            img_path = img_paths[number % len(img_paths)]
+            images.append(
+                create_linked_image(
+                    img_path, title="generated-{}-{}".format(number, img_path.name)
+                )
+            )
+        return images
+
+    def _set_images(self, page):
+        if not self.images:
+            return
+        for field in type(page)._meta.concrete_fields:
+            if field.is_relation and field.related_model is Image:
+                setattr(page, field.attname, self.rng.choice(self.images).pk)
+
+    def _setup_site(self, languages):
+        """Creates the root, the homepages and the index pages with ``Page.save``."""
+        LanguageRedirectionPage = apps.get_model("cms.LanguageRedirectionPage")
+        HomePage = apps.get_model("cms.HomePage")
+        ProjectIndexPage = apps.get_model("cms.ProjectIndexPage")
+        TeamMemberIndexPage = apps.get_model("cms.TeamMemberIndexPage")
+        Site = apps.get_model("wagtailcore.Site")
+
+        root = Page.get_first_root_node().add_child(
+            instance=LanguageRedirectionPage(
+                title=self.hostname,
+                slug=slugify(self.hostname),
+                show_in_menus=True,
+            )
+        )
+        Site.objects.create(
+            hostname=self.hostname, root_page=root, site_name=self.hostname
+        )
+        indexes = {}
+        for language in languages:
+            homepage = root.add_child(
+                instance=HomePage(
+                    language=language,
+                    title="Home - {}".format(language),
+                    slug=language,
+                    hero_title=self._words(3).title(),
+                    hero_intro=self._sentence(),
+                    show_in_menus=True,
+                )
+            )
+            project_index = homepage.add_child(
+                instance=ProjectIndexPage(
+                    title="Projects", slug="projects", hero_title="Projects"
+                )
+            )
+            team_member_index = homepage.add_child(
+                instance=TeamMemberIndexPage(
+                    title="Team", slug="team", hero_title="Team", show_in_menus=True
+                )
+            )
+            indexes[language] = (project_index, team_member_index)
+
+        # connect the pages for translation
+        if "en" in indexes:
+            for language, pages in indexes.items():
+                if language == "en":
+                    continue
+                for page, english_page in zip(pages, indexes["en"]):
+                    page.english_link = english_page
+                    page.save()
+        return root, indexes
+
+    def _build_project_page(self, number, language):
+        ProjectPage = apps.get_model("cms.ProjectPage")
+        name = "{} {}".format(self._words(2).title(), number)
+        values = {
+            "title": name,
+            "slug": slugify(name),
+            "hero_title": name,
+            "hero_intro": self._sentence(),
+            "project_url": "www.{}.com".format(slugify(name)),
+            "teaser_title": self._words(3).capitalize(),
+            "client": "{} GmbH".format(self._words(1).title()),
+            "services": ", ".join(self.rng.sample(WORDS, 4)),
+            "tech": ", ".join(self.rng.sample(WORDS, 3)),
+            "body": self._body(),
+            "language": language,
+        }
+        return ProjectPage(
+            **{
+                key: value
+                for key, value in values.items()
+                if has_field(ProjectPage, key)
+            }
+        )
+
+    def _build_team_member_page(self, number, language):
+        TeamMemberPage = apps.get_model("cms.TeamMemberPage")
+        name = "{} {} {}".format(
+            self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES), number
+        )
+        values = {
+            "title": name,
+            "slug": slugify(name),
+            "name": name,
+            "organisational_role": self.rng.choice(ROLES),
+            "about": "<p>{}</p>".format(self._paragraph()),
+            "body": self._body(),
+            "language": language,
+        }
+        return TeamMemberPage(
+            **{
+                key: value
+                for key, value in values.items()
+                if has_field(TeamMemberPage, key)
+            }
+        )
+
+    def _generate_pages(self, name, parents, build_page, count, batch_size):
+        """Creates ``count`` pages per language below the given parents."""
+        PageTranslation = apps.get_model("cms.PageTranslation")
+        # the english pages are inserted first, the others link to them
+        languages = sorted(parents, key=lambda language: language != "en")
+        with self.progress.phase(name, total=count * len(languages)) as phase:
+            for start in range(0, count, batch_size):
+                numbers = range(start, min(start + batch_size, count))
+                groups = [self._uuid() for __ in numbers]
+                batch = {}
+                with transaction.atomic():
+                    for language in languages:
+                        pages = []
+                        for index, number in enumerate(numbers):
+                            page = build_page(number, language)
+                            self._set_images(page)
+                            if language != "en" and "en" in batch:
+                                page.english_link_id = batch["en"][index].pk
+                            pages.append(page)
+                        batch[language] = bulk_insert_pages(parents[language], pages)
+                    PageTranslation.objects.bulk_create(
+                        PageTranslation(page_id=page.pk, group=group, language=language)
+                        for language, pages in batch.items()
+                        for page, group in zip(pages, groups)
+                    )
+                phase.advance(len(numbers) * len(languages))
+
+    def _create_main_menus(self, root, indexes):
+        from wagtailmenus.conf import settings as wagtailmenu_settings
+
+        Site = apps.get_model("wagtailcore.Site")
+        site = Site.objects.get(root_page=root)
+        menu_model = wagtailmenu_settings.models.FLAT_MENU_MODEL
+        for language, (project_index, team_member_index) in indexes.items():
+            handle = "main_menu_{}".format(language)
+            menu = menu_model.objects.create(site=site, handle=handle, title=handle)
+            item_manager = menu.get_menu_items_manager()
+            item_class = item_manager.model
+            item_manager.bulk_create(
+                item_class(
+                    menu=menu,
+                    link_text=page.title,
+                    link_page=page,
+                    sort_order=sort_order,
+                    allow_subnav=False,
+                )
+                for sort_order, page in enumerate(
+                    (project_index, team_member_index), start=1
+                )
+            )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        if not settings.DEBUG:
+            # YOU SHOULD NEVER TRUST THIS COMMAND FOR PRODUCTION USAGE.
+            raise RuntimeError("Command can not be run in production.")
+        self.hostname = options["hostname"]
+        Site = apps.get_model("wagtailcore.Site")
+        if Site.objects.filter(hostname=self.hostname).exists():
+            raise CommandError("Site {} exists. Aborting.".format(self.hostname))
+        if options["languages"]:
+            languages = options["languages"].split(",")
+        else:
+            languages = [language_code for language_code, label in settings.LANGUAGES]
+
+        self.rng = random.Random(options["seed"])
+        with ProgressReporter.from_options(options) as self.progress:
+            with self.progress.phase("images"):
+                self.images = self._create_images(options["images"])
+            root, indexes = self._setup_site(languages)
+            self._generate_pages(
+                "project_pages",
+                {language: pages[0] for language, pages in indexes.items()},
+                self._build_project_page,
+                options["projects"],
+                options["batch_size"],
+            )
+            self._generate_pages(
+                "team_member_pages",
+                {language: pages[1] for language, pages in indexes.items()},
+                self._build_team_member_page,
+                options["team_members"],
+                options["batch_size"],
+            )
+            self._create_main_menus(root, indexes)
+            create_missing_revisions(options["batch_size"], self.progress)
+        if self.verbosity > 0:
+            total = (options["projects"] + options["team_members"]) * len(languages)
+            self.stdout.write("Generated {} pages for {}.".format(total, self.hostname))
@@ -0,0 +1,282 @@
+"""Bulk inserts of pages and the page tree fixture format.
+
+Lives next to the management commands, e.g. ``<app>/management/page_tree.py``. Used by
+``generate_page_tree``, ``export_page_tree`` and ``setup_page_tree --fixture``.
+
+A page tree fixture is a JSON lines file. The first line is the header, followed by
+the images the pages link to, the pages in path order, the translation groups and the
+sites::
+
+    {"type": "header", "version": 2}
+    {"type": "image", "id": 7, "title": "tom.jpg", "file": "original_images/tom.jpg"}
+    {"type": "page", "id": 3, "model": "cms.homepage", "fields": {...}}
+    {"type": "translation", "page": 3, "group": "...", "language": "de"}
+    {"type": "site", "root_page": 3, "fields": {...}}
+
+Ids are the ids of the exported database. They are only used to connect the lines.
+Links to pages and images are remapped when loading. Pages must not require links to
+anything else, optional ones are not exported and left empty.
+"""
+
+import datetime
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.apps import apps
+from django.db.models import Case, CharField, F, OuterRef, Subquery, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+from wagtail.core.models import Locale, Page, Revision
+from wagtail.images.models import Image
+
+from codista.cms.models import get_specific_pages
+
+FIXTURE_VERSION = 2
+
+# not exported, the revisions and users they point to are not part of the fixture.
+# The pages are loaded into the default locale.
+EXCLUDED_PAGE_FIELDS = {
+    "content_type",
+    "latest_revision",
+    "live_revision",
+    "latest_revision_created_at",
+    "locale",
+    "locked",
+    "locked_at",
+    "locked_by",
+    "owner",
+}
+
+# all generated pages are published at the same (fixed) time
+PUBLISHED_AT = datetime.datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def insert_pages(pages):
+    """Inserts pages without calling ``Page.save``.
+
+    The pages need all their tree fields (``path``, ``depth``, ``numchild``,
+    ``url_path``) and their ``content_type``. Pages without ``locale`` get the default
+    locale. The ``Page`` rows are inserted with one ``bulk_create`` and the rows of the
+    specific model (and of every concrete model in between) with one insert each.
+    Signals are not sent and the search index is not updated.
+    """
+    model = type(pages[0])
+    if any(page.locale_id is None for page in pages):
+        default_locale_id = Locale.get_default().pk
+        for page in pages:
+            if page.locale_id is None:
+                page.locale_id = default_locale_id
+    base_pages = [
+        Page(
+            **{
+                field.attname: getattr(page, field.attname)
+                for field in Page._meta.concrete_fields
+                if not field.primary_key
+            }
+        )
+        for page in pages
+    ]
+    Page.objects.bulk_create(base_pages)
+    parent_models = model._meta.get_parent_list()
+    for page, base_page in zip(pages, base_pages):
+        page.id = base_page.pk
+        for parent_model in parent_models:
+            setattr(page, model._meta.get_ancestor_link(parent_model).attname, page.id)
+    # the concrete models between ``Page`` and the specific model, top down
+    for table_model in reversed([model] + parent_models):
+        if table_model is Page or table_model._meta.proxy:
+            continue
+        table_model._base_manager._insert(
+            pages, fields=table_model._meta.local_concrete_fields
+        )
+    return pages
+
+
+def bulk_insert_pages(parent, pages):
+    """Inserts published pages as children of ``parent`` (see ``insert_pages``)."""
+    model = type(pages[0])
+    content_type = apps.get_model("contenttypes.ContentType").objects.get_for_model(
+        model
+    )
+    depth = parent.depth + 1
+    for position, page in enumerate(pages, start=parent.numchild + 1):
+        page.path = Page._get_path(parent.path, depth, position)
+        page.depth = depth
+        page.numchild = 0
+        page.url_path = "{}{}/".format(parent.url_path, page.slug)
+        page.draft_title = page.title
+        page.content_type = content_type
+        page.locale_id = parent.locale_id
+        page.live = True
+        page.has_unpublished_changes = False
+        page.first_published_at = PUBLISHED_AT
+        page.last_published_at = PUBLISHED_AT
+    insert_pages(pages)
+    Page.objects.filter(pk=parent.pk).update(numchild=F("numchild") + len(pages))
+    parent.numchild += len(pages)
+    return pages
+
+
+def bulk_create_revisions(pages, user=None):
+    """Creates a revision of the current content of every given page.
+
+    Calling ``save_revision`` per page needs several queries each. Here all revisions
+    are created with one ``bulk_create``, and ``latest_revision``,
+    ``latest_revision_created_at`` and ``live_revision`` (of the live pages) are set
+    with one update.
+    """
+    pages = get_specific_pages(pages)
+    if not pages:
+        return
+    now = timezone.now()
+    Revision.objects.bulk_create(
+        Revision(
+            content_type_id=page.content_type_id,
+            base_content_type=page.get_base_content_type(),
+            object_id=str(page.pk),
+            content=page.serializable_data(),
+            object_str=str(page),
+            created_at=now,
+            user=user,
+        )
+        for page in pages
+    )
+    # ``object_id`` is a string, to hold the keys of any model
+    latest_revision = (
+        Revision.page_revisions.filter(
+            object_id=Cast(OuterRef("pk"), output_field=CharField())
+        )
+        .order_by("-created_at", "-pk")
+        .values("pk")[:1]
+    )
+    Page.objects.filter(pk__in=[page.pk for page in pages]).update(
+        latest_revision=Subquery(latest_revision),
+        latest_revision_created_at=now,
+        live_revision=Case(
+            When(live=True, then=Subquery(latest_revision)), default=None
+        ),
+    )
+
+
+def create_missing_revisions(chunk_size=2000, progress=None):
+    """Creates revisions for all pages which have none, e.g. seeded pages.
+
+    Reports to ``progress`` (a ``ProgressReporter``), if given.
+    """
+    pages = Page.objects.filter(
+        depth__gt=1, latest_revision_created_at__isnull=True
+    ).order_by("path")
+    phase = None
+    with ExitStack() as stack:
+        if progress:
+            phase = stack.enter_context(
+                progress.phase("create_revisions", total=pages.count())
+            )
+        last_path = ""
+        while True:
+            # continues after the last chunk, so no query skips the pages done so far
+            chunk = list(pages.filter(path__gt=last_path)[:chunk_size])
+            if not chunk:
+                return
+            bulk_create_revisions(chunk)
+            last_path = chunk[-1].path
+            if phase:
+                phase.advance(len(chunk))
+
+
+def is_page_link(field):
+    """Foreign keys to other pages, which are remapped when loading a fixture."""
+    return (
+        field.is_relation
+        and not field.remote_field.parent_link
+        and issubclass(field.related_model, Page)
+    )
+
+
+def is_image_link(field):
+    """Foreign keys to images, the images are exported with the pages."""
+    return field.is_relation and issubclass(field.related_model, Image)
+
+
+@lru_cache(maxsize=None)
+def get_exported_fields(model):
+    """The fields of the fixture lines of ``model``.
+
+    Raises ``ValueError`` when the model requires a link to something which is not
+    part of the fixture.
+    """
+    fields = []
+    for field in model._meta.concrete_fields:
+        if (
+            field.primary_key
+            or (field.is_relation and field.remote_field.parent_link)
+            or field.name in EXCLUDED_PAGE_FIELDS
+        ):
+            continue
+        if field.is_relation and not (is_page_link(field) or is_image_link(field)):
+            if not field.null:
+                raise ValueError(
+                    "{}.{} links to {}, which page tree fixtures do not contain.".format(
+                        model._meta.label, field.name, field.related_model._meta.label
+                    )
+                )
+            # left empty when loading
+            continue
+        fields.append(field)
+    return fields
+
+
+def serialize_image(image) -> dict:
+    """The fixture line of an image a page links to."""
+    return {
+        "type": "image",
+        "id": image.pk,
+        "title": image.title,
+        "file": image.file.name,
+    }
+
+
+def serialize_page(page) -> dict:
+    """The fixture line of a specific page."""
+    fields = {}
+    for field in get_exported_fields(type(page)):
+        value = field.value_from_object(page)
+        if field.is_relation:
+            value = getattr(page, field.attname)
+        elif not isinstance(value, (type(None), bool, int, float, str)):
+            # dates, StreamField data, ...
+            value = field.value_to_string(page)
+        fields[field.name] = value
+    return {
+        "type": "page",
+        "id": page.pk,
+        "model": page._meta.label_lower,
+        "fields": fields,
+    }
+
+
+def deserialize_page(data, image_ids):
+    """Returns the page and its links to other pages of a fixture line.
+
+    ``image_ids`` maps the ids of the image lines to the images of this database. The
+    page links are not set, the linked pages may not be loaded yet.
+    """
+    model = apps.get_model(data["model"])
+    page = model(
+        content_type=apps.get_model("contenttypes.ContentType").objects.get_for_model(
+            model
+        )
+    )
+    page_links = {}
+    for field in get_exported_fields(model):
+        if field.name not in data["fields"]:
+            continue
+        value = data["fields"][field.name]
+        if is_page_link(field):
+            if value is not None:
+                page_links[field.attname] = value
+        elif is_image_link(field):
+            setattr(page, field.attname, image_ids.get(value))
+        else:
+            setattr(page, field.attname, field.to_python(value))
+    return page, page_links
@@ -1,15 +1,44 @@
+import ast
+import fcntl
 import json
 import logging
+import os
+import shutil
+from collections import Counter, defaultdict
 from pathlib import Path
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files import File
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from wagtail.core.models import Page
 from wagtail.images.models import Image
 
+from ..page_tree import (
+    FIXTURE_VERSION,
+    create_missing_revisions,
+    deserialize_page,
+    insert_pages,
+)
+from ..plan import (
+    ADD_CHILD_QUERIES,
+    QUERY_METHODS,
+    SAVE_QUERIES,
+    Estimate,
+    get_call_name,
+    get_chunks,
+    get_keyword,
+    get_method_nodes,
+    get_model_names,
+    get_tables,
+    iter_calls,
+    plan_files,
+)
+from ..progress import ProgressReporter
+from ..watch import FixtureWatcher
+
 User = get_user_model()
 
 APP_DIR = Path(__file__).resolve().parent.parent.parent
@@ -17,6 +46,93 @@ FIXTURES_DIR = APP_DIR.joinpath("fixtures")
 
 logger = logging.getLogger("setup_page_tree")
 
+# ioctl which clones a file on copy-on-write filesystems (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def link_file(source, target):
+    """Places ``source`` at ``target`` without copying its bytes, if possible.
+
+    Tries a reflink first (the file is shared until one of them changes), then a
+    hardlink. Falls back to copying, e.g. when both are on different filesystems.
+    """
+    try:
+        with open(source, "rb") as source_file, open(target, "wb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        return "reflink"
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        shutil.copyfile(source, target)
+        return "copy"
+
+
+def create_linked_image(img_path, title=None):
+    """Creates an image whose file is linked to the fixture file."""
+    image = Image(title=title or img_path.name)
+    storage = image.file.storage
+    # same name as an upload would get
+    name = storage.get_available_name(
+        image.file.field.generate_filename(image, img_path.stem)
+    )
+    try:
+        target = Path(storage.path(name))
+    except NotImplementedError:
+        # not a local storage, e.g. S3
+        with open(img_path, "rb") as f:
+            image.file = File(f, name=img_path.stem)
+            image.save()
+        return image
+    target.parent.mkdir(parents=True, exist_ok=True)
+    mode = link_file(img_path, target)
+    logger.debug("%s placed at %s (%s)", img_path.name, target, mode)
+    # the dimensions are read from the placed file
+    image.file = name
+    image.save()
+    return image
+
+
+def get_or_create_image(img_path, link_media=False):
+    """The image titled after the fixture file, created from the file if missing."""
+    image = Image.objects.filter(title=img_path.name).first()
+    if image is not None:
+        return image
+    if link_media:
+        return create_linked_image(img_path)
+    with open(img_path, "rb") as f:
+        # setting name= is important. otherwise it uses the entire file path as
+        # name, which leaks server filesystem structure to the outside.
+        image_file = File(f, name=img_path.stem)
+        image = Image(title=img_path.name, file=image_file.open())
+        image.save()
+    return image
+
+
+def load_fixture_image(data, link_media=False):
+    """Id of the image of a fixture ``image`` line in this database.
+
+    The image is looked up by its title. If missing, it is created from the fixture
+    image of that name or else from the exported file, if the media storage has it.
+    ``None`` when neither exists, the links to the image are left empty then.
+    """
+    image = Image.objects.filter(title=data["title"]).first()
+    img_path = FIXTURES_DIR.joinpath("img", data["title"])
+    storage = Image._meta.get_field("file").storage
+    if image is None and img_path.is_file():
+        image = get_or_create_image(img_path, link_media)
+    elif image is None and storage.exists(data["file"]):
+        # the dimensions are read from the file
+        image = Image(title=data["title"], file=data["file"])
+        image.save()
+    if image is None:
+        logger.warning("Image %s not found, its links are left empty.", data["title"])
+        return None
+    return image.pk
+
 
 class Command(BaseCommand):
     """
@@ -25,30 +141,64 @@ class Command(BaseCommand):
 
     help = "creates initial wagtail cms page tree"
     requires_system_checks = False
+    # the ProgressReporter of a calling command, e.g. total_reset
+    stealth_options = ("progress",)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--link-media",
+            action="store_true",
+            help="Reflink / hardlink the fixture images into MEDIA_ROOT instead of "
+            "copying them.",
+        )
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="Print what would be created, with estimated queries and inserts, as "
+            "JSON without writing anything. The setup is estimated from the source of "
+            "its steps: calls in helper functions and in loops over data (other than "
+            "literals and settings) are counted once.",
+        )
+        parser.add_argument(
+            "--fixture",
+            help="Load the page tree from a fixture written by export_page_tree.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="DEV ONLY: Keep running and apply changes of the fixture images and of "
+            "the --fixture to the page tree in place. Skips creating the page tree "
+            "when it exists already.",
+        )
+        ProgressReporter.add_arguments(parser)
 
     def _setup(self):
-        self._setup_language_redirection()
-        self._setup_home()
-        self._setup_team_member_index()
-        self._setup_team_member_pages()
-        # finally, create the menus
-        self._create_main_menu()
-        self._create_flat_menus()
+        steps = [
+            self._setup_language_redirection,
+            self._setup_home,
+            self._setup_team_member_index,
+            self._setup_team_member_pages,
+            # finally, create the menus
+            self._create_main_menu,
+            self._create_flat_menus,
+            self._create_revisions,
+        ]
+        with self.progress.phase("setup_page_tree", total=len(steps)) as phase:
+            for step in steps:
+                with self.progress.phase(step.__name__.lstrip("_")):
+                    step()
+                phase.advance()
+
+    def _create_revisions(self):
+        """The admin expects every page to have a revision."""
+        create_missing_revisions()
 
     def _set_image(self, obj, attr_name, folder_path, img_path):
         """helper to set images for objects"""
         img_path = folder_path.joinpath(img_path)
         # create and set the file if it does not yet exist
-        qs = Image.objects.filter(title=img_path.name)
-        if not qs.exists():
-            with open(img_path, "rb") as f:
-                # setting name= is important. otherwise it uses the entire file path as
-                # name, which leaks server filesystem structure to the outside.
-                image_file = File(f, name=img_path.stem)
-                image = Image(title=img_path.name, file=image_file.open())
-                image.save()
-        else:
-            image = qs[0]
+        image = get_or_create_image(img_path, self.link_media)
         setattr(obj, attr_name, image)
         obj.save()
 
@@ -545,17 +695,278 @@ class Command(BaseCommand):
             )
             item_manager.bulk_create(item_list)
 
+    def _insert_fixture_pages(self, chunk, id_map, image_ids, page_links):
+        """Inserts a chunk of fixture pages, one insert per model and table."""
+        pages_by_model = defaultdict(list)
+        for data in chunk:
+            page, links = deserialize_page(data, image_ids)
+            pages_by_model[type(page)].append((data["id"], page, links))
+        for model, entries in pages_by_model.items():
+            insert_pages([page for __, page, __ in entries])
+            for old_id, page, links in entries:
+                id_map[old_id] = page.pk
+                for attname, old_target_id in links.items():
+                    page_links[(model, attname)].append((page.pk, old_target_id))
+
+    def _load_fixture(self, fixture_path, chunk_size):
+        """Loads a fixture written by ``export_page_tree``.
+
+        The exported paths are kept, so the pages can be inserted in chunks no matter
+        whether their parents are in the same chunk. Links between pages are set when
+        all pages are there. The images the pages link to are looked up or created
+        first (see ``load_fixture_image``).
+        """
+        PageTranslation = apps.get_model("cms.PageTranslation")
+        Site = apps.get_model("wagtailcore.Site")
+        # the default homepage created by wagtail migrations
+        Page.objects.filter(depth__gt=1).delete()
+        id_map = {}
+        image_ids = {}
+        page_links = defaultdict(list)
+        chunk = []
+        translations = []
+        with open(fixture_path, encoding="utf-8") as f, self.progress.phase(
+            "load_fixture"
+        ) as phase:
+            for line in f:
+                data = json.loads(line)
+                if data["type"] == "header":
+                    if data["version"] != FIXTURE_VERSION:
+                        raise CommandError(
+                            "Unsupported fixture version {}.".format(data["version"])
+                        )
+                    continue
+                if data["type"] == "image":
+                    image_ids[data["id"]] = load_fixture_image(data, self.link_media)
+                    continue
+                if data["type"] == "page":
+                    chunk.append(data)
+                    if len(chunk) >= chunk_size:
+                        self._insert_fixture_pages(chunk, id_map, image_ids, page_links)
+                        phase.advance(len(chunk))
+                        chunk = []
+                    continue
+                # all pages come before the translations and sites
+                if chunk:
+                    self._insert_fixture_pages(chunk, id_map, image_ids, page_links)
+                    phase.advance(len(chunk))
+                    chunk = []
+                if data["type"] == "translation":
+                    translations.append(
+                        PageTranslation(
+                            page_id=id_map[data["page"]],
+                            group=data["group"],
+                            language=data["language"],
+                        )
+                    )
+                    if len(translations) >= chunk_size:
+                        PageTranslation.objects.bulk_create(translations)
+                        translations = []
+                elif data["type"] == "site":
+                    Site.objects.create(
+                        root_page_id=id_map[data["root_page"]], **data["fields"]
+                    )
+            if chunk:
+                self._insert_fixture_pages(chunk, id_map, image_ids, page_links)
+                phase.advance(len(chunk))
+            PageTranslation.objects.bulk_create(translations)
+
+        for (model, attname), links in page_links.items():
+            model._base_manager.bulk_update(
+                [
+                    model(**{"pk": page_id, attname: id_map.get(old_target_id)})
+                    for page_id, old_target_id in links
+                ],
+                [attname],
+                batch_size=chunk_size,
+            )
+        Page.objects.filter(depth=1).update(
+            numchild=Page.objects.filter(depth=2).count()
+        )
+
+    def _estimate_revisions(self, estimate, pages, chunk_size):
+        """Adds ``create_missing_revisions`` of the pages (a ``Counter`` by model)."""
+        count = sum(pages.values())
+        # the count and the last, empty chunk. Each chunk selects the pages, loads
+        # their specific instances, inserts the revisions and updates the pages.
+        estimate.add(2 + get_chunks(count, chunk_size) * (3 + len(pages)))
+        revision_table = apps.get_model("wagtailcore.Revision")._meta.db_table
+        estimate.add(inserts=[revision_table], times=count)
+
+    def _plan_setup(self, chunk_size):
+        """Counts what the setup steps create, from their source.
+
+        Nothing is run: the steps listed in ``_setup`` are parsed, calls of page
+        models, menus, menu items and sites are counted (times the languages, when in
+        a loop over them) and the images are taken from the ``_set_image`` calls.
+        Queries are estimated from the created objects and the other ORM calls.
+        """
+        from wagtailmenus.conf import settings as wagtailmenu_settings
+
+        menu_model = wagtailmenu_settings.models.FLAT_MENU_MODEL
+        item_model = menu_model._meta.get_field(
+            wagtailmenu_settings.FLAT_MENU_ITEMS_RELATED_NAME
+        ).related_model
+        site_table = apps.get_model("wagtailcore.Site")._meta.db_table
+        methods = get_method_nodes(type(self))
+        steps = [
+            element.attr
+            for node in ast.walk(methods["_setup"])
+            if isinstance(node, ast.Assign)
+            and any(getattr(target, "id", None) == "steps" for target in node.targets)
+            for element in node.value.elts
+        ]
+        estimate = Estimate()
+        pages = Counter()
+        counts = Counter()
+        image_names = set()
+        for step in steps:
+            models = get_model_names(methods[step])
+            for call, times in iter_calls(methods[step]):
+                name = get_call_name(call)
+                method = name.rpartition(".")[2]
+                if name in models:
+                    model = apps.get_model(models[name])
+                    if issubclass(model, Page):
+                        pages[model] += times
+                        tables = get_tables(model)
+                        estimate.add(ADD_CHILD_QUERIES + len(tables), tables, times)
+                elif name == "self._set_image":
+                    image_names.add(get_keyword(call, "img_path"))
+                    # the lookup of the image by its title and the save of the page
+                    estimate.add(1 + SAVE_QUERIES, times=times)
+                elif name == "menu_model.objects.get_or_create":
+                    counts["menus"] += times
+                    estimate.add(2, [menu_model._meta.db_table], times)
+                elif name == "item_class":
+                    # inserted with one bulk_create per menu
+                    counts["menu_items"] += times
+                    estimate.add(inserts=[item_model._meta.db_table], times=times)
+                elif name == "Site.objects.create":
+                    counts["sites"] += times
+                    estimate.add(1, [site_table], times)
+                elif method == "save":
+                    estimate.add(SAVE_QUERIES, times=times)
+                elif method in QUERY_METHODS:
+                    estimate.add(1, times=times)
+        # every image is created once
+        estimate.add(1, [Image._meta.db_table], len(image_names))
+        self._estimate_revisions(estimate, pages, chunk_size)
+        images_path = FIXTURES_DIR.joinpath("img")
+        plan = {
+            "pages": dict(
+                sorted(
+                    (model._meta.label_lower, count) for model, count in pages.items()
+                )
+            ),
+            "revisions": sum(pages.values()),
+            "sites": counts["sites"],
+            "menus": counts["menus"],
+            "menu_items": counts["menu_items"],
+        }
+        plan.update(plan_files(images_path.joinpath(name) for name in image_names))
+        plan.update(estimate.as_dict())
+        return plan
+
+    def _plan_fixture(self, fixture_path, chunk_size):
+        """Counts the records of the fixture, without loading it.
+
+        Queries are estimated from the inserts in chunks of ``_load_fixture``.
+        """
+        pages = Counter()
+        counts = Counter()
+        image_titles = []
+        with open(fixture_path, encoding="utf-8") as f:
+            for line in f:
+                data = json.loads(line)
+                if data["type"] == "header":
+                    if data["version"] != FIXTURE_VERSION:
+                        raise CommandError(
+                            "Unsupported fixture version {}.".format(data["version"])
+                        )
+                elif data["type"] == "image":
+                    image_titles.append(data["title"])
+                elif data["type"] == "page":
+                    pages[apps.get_model(data["model"])] += 1
+                else:
+                    counts[data["type"]] += 1
+        estimate = Estimate()
+        # the default homepage is deleted, the numchild of the root updated
+        estimate.add(2)
+        for model, count in pages.items():
+            tables = get_tables(model)
+            # one insert per table and chunk
+            estimate.add(len(tables), times=get_chunks(count, chunk_size))
+            estimate.add(inserts=tables, times=count)
+        translation_table = apps.get_model("cms.PageTranslation")._meta.db_table
+        estimate.add(1, times=get_chunks(counts["translation"], chunk_size))
+        estimate.add(inserts=[translation_table], times=counts["translation"])
+        site_table = apps.get_model("wagtailcore.Site")._meta.db_table
+        estimate.add(1, [site_table], counts["site"])
+        # looked up by title, created when missing (an upper bound)
+        estimate.add(2, [Image._meta.db_table], len(image_titles))
+        self._estimate_revisions(estimate, pages, chunk_size)
+        plan = {
+            "pages": dict(
+                sorted(
+                    (model._meta.label_lower, count) for model, count in pages.items()
+                )
+            ),
+            "revisions": sum(pages.values()),
+            "translations": counts["translation"],
+            "sites": counts["site"],
+        }
+        # existing images are reused, missing fixture images are taken from the media
+        # storage when it has them
+        images_path = FIXTURES_DIR.joinpath("img")
+        plan.update(plan_files(images_path.joinpath(title) for title in image_titles))
+        plan.update(estimate.as_dict())
+        return plan
+
+    def _plan(self, options):
+        """Returns what the command would create, nothing is written."""
+        if options["fixture"]:
+            return self._plan_fixture(options["fixture"], options["chunk_size"])
+        return self._plan_setup(options["chunk_size"])
+
+    def _watch(self, options):
+        """Applies changes of the fixtures until interrupted, see ``watch.py``."""
+        watcher = FixtureWatcher(
+            FIXTURES_DIR.joinpath("img"),
+            fixture_path=options["fixture"],
+            link_media=options["link_media"],
+            stdout=self.stdout,
+            stderr=self.stderr,
+        )
+        watcher.run()
+
     def handle(self, raise_error=False, *args, **options):
         # Root Page and a default homepage are created by wagtail migrations
         # so check for > 2 here
         verbosity = options["verbosity"]
+        if options["plan"]:
+            self.stdout.write(json.dumps(self._plan(options), indent=2))
+            return
+        if options["watch"] and not settings.DEBUG:
+            raise RuntimeError("Command can not be run in production.")
         checks = [Page.objects.all().count() > 2]
+        if any(checks) and options["watch"]:
+            self._watch(options)
+            return
         if any(checks):
             # YOU SHOULD NEVER RUN THIS COMMAND WITHOUT PRIOR DB DUMP
             raise RuntimeError("Pages exists. Aborting.")
 
-        self._setup()
+        self.link_media = options["link_media"]
+        with ProgressReporter.from_options(options) as self.progress:
+            if options["fixture"]:
+                with transaction.atomic():
+                    self._load_fixture(options["fixture"], options["chunk_size"])
+                    create_missing_revisions(options["chunk_size"], self.progress)
+            else:
+                self._setup()
         if verbosity > 0:
             msg = "Page Tree successfully created."
             self.stdout.write(msg)
-
+        if options["watch"]:
+            self._watch(options)
@@ -0,0 +1,442 @@
+"""Applies changes of the seeding fixtures to an existing page tree.
+
+Lives next to the management commands, e.g. ``<app>/management/watch.py``. Used by
+``setup_page_tree --watch``. Polls the fixture images and (if given) a page tree
+fixture (see ``page_tree.py``) and applies what changed in place:
+
+* changed images replace the file of the images created from them
+* added images are created for the image lines of the fixture which had none so far
+* changed, added and removed pages of the fixture are updated, added and deleted
+* a page whose model changed is deleted and added again, with its descendants
+* changed translation lines move the page into the given translation group
+* added image lines are looked up or created like when loading the fixture
+
+The fixture is only read when its modification time or size changed. Its lines are
+compared as text, only the changed lines are parsed. Pages are
+matched by their path in the fixture, so the tree has to be loaded from the fixture
+(``setup_page_tree --fixture``) first.
+
+Errors, e.g. a ``ValidationError`` of a changed page, are reported and the watcher
+keeps polling. The changes of the fixture are applied in one transaction, failed lines
+are applied again with the next change of the fixture.
+"""
+
+import json
+import os
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+from django.apps import apps
+from django.core.files import File
+from django.db import transaction
+from wagtail.core.models import Page
+from wagtail.images.models import Image
+
+from codista.cms.models import add_to_translation_group
+
+from .page_tree import (
+    bulk_create_revisions,
+    deserialize_page,
+    get_exported_fields,
+    is_image_link,
+    is_page_link,
+)
+
+# set by treebeard / wagtail when a page is added to the tree
+TREE_FIELDS = {"path", "depth", "numchild", "url_path"}
+
+
+def get_file_state(path) -> tuple:
+    """Modification time and size of the file."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_file_states(folder_path) -> dict:
+    """Modification time and size of every file in the folder."""
+    return {
+        path.name: get_file_state(path)
+        for path in Path(folder_path).iterdir()
+        if path.is_file()
+    }
+
+
+def read_fixture_lines(fixture_path) -> dict:
+    """The lines of the fixture, keyed by their text, in file order."""
+    with open(fixture_path, encoding="utf-8") as f:
+        return dict.fromkeys(line.rstrip("\n") for line in f if line.strip())
+
+
+def load_image_lines(lines, link_media=False) -> dict:
+    """Maps the ids of the image lines to the images of this database."""
+    # imported late, the command module imports this module
+    from .commands.setup_page_tree import load_fixture_image
+
+    return {
+        data["id"]: load_fixture_image(data, link_media)
+        for data in lines
+        if data["type"] == "image"
+    }
+
+
+def replace_image_file(image, img_path, link_media=False):
+    """Gives the image the content of ``img_path`` and drops its renditions."""
+    # imported late, the command module imports this module
+    from .commands.setup_page_tree import link_file
+
+    storage = image.file.storage
+    old_name = image.file.name
+    image.renditions.all().delete()
+    # recalculated on next access
+    image.file_size = None
+    image.file_hash = ""
+    name = storage.get_available_name(
+        image.file.field.generate_filename(image, img_path.stem)
+    )
+    try:
+        target = Path(storage.path(name)) if link_media else None
+    except NotImplementedError:
+        # not a local storage, e.g. S3
+        target = None
+    if target is None:
+        with open(img_path, "rb") as f:
+            image.file = File(f, name=img_path.stem)
+            image.save()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        link_file(img_path, target)
+        # the dimensions are read from the placed file
+        image.file = name
+        image.save()
+    storage.delete(old_name)
+
+
+class FixtureWatcher:
+    """Polls the fixture sources and applies their changes.
+
+    Args:
+        images_path: the folder of the fixture images.
+        fixture_path: a page tree fixture, or ``None`` to only watch the images.
+        stdout: where to report the applied changes (an ``OutputWrapper``).
+        stderr: where to report errors, defaults to ``stdout``.
+    """
+
+    def __init__(
+        self, images_path, fixture_path=None, link_media=False, stdout=None, stderr=None
+    ):
+        self.images_path = Path(images_path)
+        self.fixture_path = fixture_path
+        self.link_media = link_media
+        self.stdout = stdout
+        self.stderr = stderr or stdout
+        self.image_states = get_file_states(self.images_path)
+        self.fixture_lines = {}
+        self.fixture_state = None
+        # fixture page id -> fixture path, fixture path -> page id in the database
+        self.fixture_paths = {}
+        self.page_ids = {}
+        # fixture image id -> image id in the database, and its line
+        self.image_ids = {}
+        self.image_lines = {}
+        if fixture_path:
+            self.fixture_state = get_file_state(fixture_path)
+            self.fixture_lines = read_fixture_lines(fixture_path)
+            lines = [json.loads(line) for line in self.fixture_lines]
+            self.image_ids = load_image_lines(lines, link_media)
+            self.image_lines = {
+                data["id"]: data for data in lines if data["type"] == "image"
+            }
+            pages = [data for data in lines if data["type"] == "page"]
+            self.fixture_paths = {data["id"]: data["fields"]["path"] for data in pages}
+            self.page_ids = dict(
+                Page.objects.filter(path__in=self.fixture_paths.values()).values_list(
+                    "path", "pk"
+                )
+            )
+
+    def _report(self, msg):
+        if self.stdout:
+            self.stdout.write(msg)
+
+    def _report_error(self, msg):
+        if self.stderr:
+            self.stderr.write(msg)
+
+    def run(self, interval=0.5):
+        """Polls until interrupted."""
+        self._report("Watching {} for changes.".format(self.images_path))
+        if self.fixture_path:
+            self._report("Watching {} for changes.".format(self.fixture_path))
+        try:
+            while True:
+                time.sleep(interval)
+                self.sync()
+        except KeyboardInterrupt:
+            pass
+
+    def sync(self):
+        """Applies the changes since the last call, reports errors."""
+        start = time.perf_counter()
+        changes = 0
+        steps = [self.sync_images]
+        if self.fixture_path:
+            steps.append(self.sync_fixture)
+        for step in steps:
+            try:
+                changes += step()
+            except Exception:
+                # e.g. a fixture line which does not validate, fixed by editing it
+                self._report_error(traceback.format_exc())
+        if changes:
+            self._report(
+                "Applied {} change(s) in {:.2f}s.".format(
+                    changes, time.perf_counter() - start
+                )
+            )
+        return changes
+
+    def sync_images(self):
+        states = get_file_states(self.images_path)
+        changed = [
+            name
+            for name, state in states.items()
+            if self.image_states.get(name, state) != state
+        ]
+        added = sorted(set(states) - set(self.image_states))
+        for name in set(self.image_states) - set(states):
+            self._report("Image {} was removed, its images are kept.".format(name))
+        self.image_states = states
+        count = self._add_images(added) if added else 0
+        for name in changed:
+            # ``setup_page_tree`` names the images after their fixture file
+            for image in Image.objects.filter(title=name):
+                replace_image_file(
+                    image, self.images_path.joinpath(name), self.link_media
+                )
+                count += 1
+            self._report("Image {} updated.".format(name))
+        return count
+
+    def sync_fixture(self):
+        try:
+            state = get_file_state(self.fixture_path)
+            if state == self.fixture_state:
+                return 0
+            lines = read_fixture_lines(self.fixture_path)
+            added = [
+                json.loads(line) for line in lines if line not in self.fixture_lines
+            ]
+            removed = [
+                json.loads(line) for line in self.fixture_lines if line not in lines
+            ]
+        except (OSError, ValueError):
+            # e.g. while an editor writes the file, tried again on the next poll
+            return 0
+        self.fixture_state = state
+        if not added and not removed:
+            return 0
+        new_pages = {
+            data["fields"]["path"]: data for data in added if data["type"] == "page"
+        }
+        old_pages = {
+            data["fields"]["path"]: data for data in removed if data["type"] == "page"
+        }
+        if any(data["type"] in ("header", "site") for data in added + removed):
+            self._report(
+                "The header or the sites of the fixture changed, which is not applied. "
+                "Run total_reset to start over."
+            )
+        # restored when applying fails, the lines are compared to the old ones again
+        # with the next change of the fixture
+        previous = self._get_sync_state()
+        self.fixture_lines = lines
+        try:
+            with transaction.atomic():
+                self.image_ids.update(load_image_lines(added, self.link_media))
+                self.image_lines.update(
+                    (data["id"], data) for data in added if data["type"] == "image"
+                )
+                for data in new_pages.values():
+                    self.fixture_paths[data["id"]] = data["fields"]["path"]
+                replaced = set()
+                # parents before their children
+                for path in sorted(new_pages):
+                    if path in replaced:
+                        continue
+                    if path not in old_pages:
+                        self._add_page(new_pages[path])
+                    elif new_pages[path]["model"] != old_pages[path]["model"]:
+                        replaced |= self._replace_page(new_pages[path])
+                    else:
+                        self._update_page(new_pages[path])
+                # children before their parents
+                for path in sorted(set(old_pages) - set(new_pages), reverse=True):
+                    self._remove_page(path)
+                for data in added:
+                    if data["type"] == "translation":
+                        self._set_translation(data)
+        except Exception:
+            self._set_sync_state(previous)
+            raise
+        return len(set(new_pages) | set(old_pages))
+
+    def _get_sync_state(self):
+        return tuple(
+            dict(mapping)
+            for mapping in (
+                self.fixture_lines,
+                self.fixture_paths,
+                self.page_ids,
+                self.image_ids,
+                self.image_lines,
+            )
+        )
+
+    def _set_sync_state(self, state):
+        (
+            self.fixture_lines,
+            self.fixture_paths,
+            self.page_ids,
+            self.image_ids,
+            self.image_lines,
+        ) = state
+
+    def _get_fixture_lines(self, line_type):
+        """The parsed lines of the fixture of the given type."""
+        lines = (json.loads(line) for line in self.fixture_lines)
+        return [data for data in lines if data["type"] == line_type]
+
+    def _add_images(self, names):
+        """Creates the images of the image lines which had none so far.
+
+        The pages linking to them get them set. Returns the number of images created.
+        """
+        missing = [
+            data
+            for image_id, data in self.image_lines.items()
+            if self.image_ids.get(image_id) is None and data["title"] in names
+        ]
+        previous = self._get_sync_state()
+        try:
+            with transaction.atomic():
+                found = {
+                    image_id: pk
+                    for image_id, pk in load_image_lines(
+                        missing, self.link_media
+                    ).items()
+                    if pk is not None
+                }
+                self.image_ids.update(found)
+                self._relink_pages(is_image_link, set(found))
+        except Exception:
+            self._set_sync_state(previous)
+            raise
+        used = {self.image_lines[image_id]["title"] for image_id in found}
+        for name in names:
+            if name in used:
+                self._report("Image {} added.".format(name))
+            else:
+                self._report(
+                    "Image {} added, no image line of the fixture uses it.".format(name)
+                )
+        return len(found)
+
+    def _relink_pages(self, is_link, targets, exclude=()):
+        """Updates the pages whose ``is_link`` fields link to the fixture ids."""
+        for data in self._get_fixture_lines("page"):
+            path = data["fields"]["path"]
+            if path in exclude or path not in self.page_ids:
+                continue
+            fields = get_exported_fields(apps.get_model(data["model"]))
+            if any(
+                is_link(field) and data["fields"].get(field.name) in targets
+                for field in fields
+            ):
+                self._update_page(data)
+
+    def _set_page_fields(self, page, data):
+        new_page, links = deserialize_page(data, self.image_ids)
+        for field in get_exported_fields(type(page)):
+            if field.name in TREE_FIELDS or field.name not in data["fields"]:
+                continue
+            if is_page_link(field):
+                target_path = self.fixture_paths.get(links.get(field.attname))
+                setattr(page, field.attname, self.page_ids.get(target_path))
+            else:
+                setattr(page, field.attname, getattr(new_page, field.attname))
+
+    def _update_page(self, data):
+        page = Page.objects.get(pk=self.page_ids[data["fields"]["path"]]).specific
+        self._set_page_fields(page, data)
+        # also updates the urls of the descendants, when the slug changed
+        page.save()
+        bulk_create_revisions([page])
+        self._report("Page {} updated.".format(page.url_path))
+
+    def _add_page(self, data):
+        path = data["fields"]["path"]
+        parent_path = path[: -Page.steplen]
+        if parent_path not in self.page_ids:
+            raise ValueError(
+                "The parent {} of the page {} is not in the page tree.".format(
+                    parent_path, path
+                )
+            )
+        parent = Page.objects.get(pk=self.page_ids[parent_path])
+        page, __ = deserialize_page(data, self.image_ids)
+        self._set_page_fields(page, data)
+        page.numchild = 0
+        parent.add_child(instance=page)
+        # appended as last child, its path in the database may differ now
+        self.page_ids[path] = page.pk
+        bulk_create_revisions([page])
+        self._report("Page {} added.".format(page.url_path))
+
+    def _replace_page(self, data):
+        """Adds the page again with its new model, returns the paths added with it.
+
+        Deleting the page deletes its descendants, they are added again from the
+        fixture. So are their translations and the links of other pages to them.
+        """
+        path = data["fields"]["path"]
+        descendants = sorted(
+            (
+                page_data
+                for page_data in self._get_fixture_lines("page")
+                if page_data["fields"]["path"].startswith(path)
+                and page_data["fields"]["path"] != path
+            ),
+            key=lambda page_data: page_data["fields"]["path"],
+        )
+        self._remove_page(path)
+        for page_path in list(self.page_ids):
+            if page_path.startswith(path):
+                del self.page_ids[page_path]
+        pages = [data] + descendants
+        for page_data in pages:
+            self._add_page(page_data)
+        fixture_ids = {page_data["id"] for page_data in pages}
+        for translation in self._get_fixture_lines("translation"):
+            if translation["page"] in fixture_ids:
+                self._set_translation(translation)
+        paths = {page_data["fields"]["path"] for page_data in pages}
+        self._relink_pages(is_page_link, fixture_ids, exclude=paths)
+        return paths
+
+    def _remove_page(self, path):
+        page_id = self.page_ids.pop(path, None)
+        page = Page.objects.filter(pk=page_id).first()
+        # already gone with its parent
+        if page is not None:
+            page.delete()
+            self._report("Page {} removed.".format(page.url_path))
+
+    def _set_translation(self, data):
+        page_id = self.page_ids.get(self.fixture_paths.get(data["page"]))
+        if page_id is None:
+            return
+        # moves the page, that had the language in the group so far, into a group of
+        # its own and invalidates the translations of both
+        add_to_translation_group(Page.objects.get(pk=page_id), uuid.UUID(data["group"]))